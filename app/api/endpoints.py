@@ -1,15 +1,18 @@
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import QueryRequest, QueryResponse, Answer, Clause
-from app.services.document_parser import extract_text
-from app.services.chunker import chunk_text
-from app.services.embedding_engine import get_embeddings_batch, get_embedding
+from app.services.document_parser import iter_pages, fingerprint_document
+from app.services.chunker import iter_chunks, get_encoding
+from app.services.embedding_engine import get_embeddings_batch
 from app.services.vector_search import create_vector_client
 from app.services.llm_service import generate_intelligent_answer, create_clause_explanations
+from app.services.clause_matching import KeywordIndex
 from app.core.config import settings
 
 import logging
 import asyncio
 import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
 
 router = APIRouter()
 logger = logging.getLogger("endpoints")
@@ -18,13 +21,46 @@ logger = logging.getLogger("endpoints")
 try:
     vector_client = create_vector_client(
         index_name=settings.VECTOR_INDEX_NAME, 
-        dimension=settings.EMBEDDING_DIMENSION
+        dimension=settings.EMBEDDING_DIMENSION,
+        index_factory=settings.FAISS_INDEX_FACTORY,
+        query_cache_size=settings.QUERY_CACHE_SIZE,
+        assume_normalized=True  # embedding_engine returns unit-norm embeddings
     )
 except Exception as e:
     logger.error(f"Failed to initialize vector database client: {e}")
     vector_client = None
 
 
+class PartialDocument:
+    """
+    A lazily indexed document: its chunks, their keyword index and which
+    chunks have been embedded into the vector DB so far.
+    """
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.keywords = KeywordIndex(chunks)
+        self.embedded: Set[int] = set()
+
+
+# LRU of documents already indexed in the vector DB, by fingerprint (one namespace
+# each). Fully embedded documents map to None; lazily indexed ones keep their chunks
+# so later questions can embed the chunks they need. Evicted documents are reloaded
+# by _load_document, which skips the chunks already stored.
+indexed_documents: "OrderedDict[str, Optional[PartialDocument]]" = OrderedDict()
+
+# One lock per document still being indexed, so concurrent requests index it once
+_document_locks: "OrderedDict[str, asyncio.Lock]" = OrderedDict()
+
+
+def _lru_put(cache: OrderedDict, key: str, value):
+    """Insert or refresh a key, evicting the least recently used past the size limit."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max(settings.INDEXED_DOCUMENTS_CACHE_SIZE, 1):
+        cache.popitem(last=False)
+
+
 @router.post("/hackrx/run", response_model=QueryResponse)
 async def run_query(payload: QueryRequest):
     doc_url = payload.documents
@@ -41,68 +77,70 @@ async def run_query(payload: QueryRequest):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX URLs are supported.")
 
     try:
-        # Step 1: Extract document text
-        text = extract_text(doc_url, doc_type)
-        if not text.strip():
-            raise HTTPException(status_code=422, detail="Failed to extract any text from the document.")
-
-        # Step 2: Chunk text for semantic processing
-        chunks = chunk_text(text)
-        if not chunks:
-            raise HTTPException(status_code=422, detail="No valid chunks generated from document text.")
+        if not vector_client:
+            raise HTTPException(status_code=500, detail="Vector database not available")
 
-        # Step 3: Generate embeddings for chunks in batch (async)
-        chunk_embeddings = await get_embeddings_batch(
-            chunks, 
+        # Documents seen before are already in the vector DB under their own namespace
+        doc_id = await asyncio.to_thread(fingerprint_document, doc_url)
+        lock = _document_locks.get(doc_id) or asyncio.Lock()
+        _lru_put(_document_locks, doc_id, lock)
+        async with lock:
+            if doc_id in indexed_documents:
+                document = indexed_documents[doc_id]
+            else:
+                document = await _load_document(doc_url, doc_type, doc_id)
+
+            # Lazily indexed documents only embed the chunks that keyword-match the
+            # questions; under the lock, so overlapping requests don't embed a chunk twice
+            if document is not None:
+                await _index_candidates(document, doc_id, payload.questions)
+                if len(document.embedded) == len(document.chunks):
+                    document = None
+            _lru_put(indexed_documents, doc_id, document)
+
+        # Nothing is left to index, so later requests need no lock
+        if document is None and _document_locks.get(doc_id) is lock:
+            del _document_locks[doc_id]
+
+        # Step 5: Embed all questions in one batch and search their top-k chunks in one call
+        query_embs = await get_embeddings_batch(
+            payload.questions,
             provider=settings.DEFAULT_EMBEDDING_PROVIDER
         )
+        all_matches = await vector_client.query_batch_async(query_embs, top_k=settings.TOP_K_RESULTS, namespace=doc_id)
+
+        # Step 6: Build the answers concurrently
+        semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_QUERIES)
+
+        async def _answer_one(question: str, matches: List[Dict]) -> Answer:
+            async with semaphore:
+                # Extract relevant chunks and scores
+                relevant_chunks = [match['metadata']['text'] for match in matches]
+                scores = [match['score'] for match in matches]
+
+                # Generate the answer and the clause explanations side by side
+                (answer_text, rationale), matched_clauses = await asyncio.gather(
+                    generate_intelligent_answer(
+                        question=question,
+                        relevant_chunks=relevant_chunks[:3],  # Use top 3 chunks for answer
+                        provider=settings.DEFAULT_LLM_PROVIDER
+                    ),
+                    create_clause_explanations(
+                        chunks=relevant_chunks,
+                        scores=scores,
+                        question=question
+                    )
+                )
 
-        # Step 4: Upsert embeddings with metadata into vector DB
-        if vector_client:
-            vectors_to_upsert = []
-            for idx, emb in enumerate(chunk_embeddings):
-                vectors_to_upsert.append((str(idx), emb, {"text": chunks[idx]}))
-            vector_client.upsert(vectors_to_upsert)
-        else:
-            raise HTTPException(status_code=500, detail="Vector database not available")
-
-        # Step 5: Process each question: embed, search top-k chunks, build response
-        results = []
-        for question in payload.questions:
-            # Embed query
-            query_emb = await get_embedding(
-                question, 
-                provider=settings.DEFAULT_EMBEDDING_PROVIDER
-            )
-
-            # Search vector DB for top-k matching chunks
-            matches = vector_client.query(query_emb, top_k=settings.TOP_K_RESULTS)
-
-            # Extract relevant chunks and scores
-            relevant_chunks = [match['metadata']['text'] for match in matches]
-            scores = [match['score'] for match in matches]
-            
-            # Generate intelligent answer using LLM
-            answer_text, rationale = await generate_intelligent_answer(
-                question=question,
-                relevant_chunks=relevant_chunks[:3],  # Use top 3 chunks for answer
-                provider=settings.DEFAULT_LLM_PROVIDER
-            )
-            
-            # Create detailed clause explanations
-            matched_clauses = await create_clause_explanations(
-                chunks=relevant_chunks,
-                scores=scores,
-                question=question
+            return Answer(
+                answer=answer_text,
+                clauses=matched_clauses,
+                decision_rationale=rationale
             )
 
-            results.append(
-                Answer(
-                    answer=answer_text,
-                    clauses=matched_clauses,
-                    decision_rationale=rationale
-                )
-            )
+        results = await asyncio.gather(*[
+            _answer_one(q, matches) for q, matches in zip(payload.questions, all_matches)
+        ])
 
         return QueryResponse(answers=results)
 
@@ -111,6 +149,99 @@ async def run_query(payload: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Failed to process request: {str(e)}")
 
 
+async def _load_document(doc_url: str, doc_type: str, doc_id: str) -> Optional[PartialDocument]:
+    """
+    Index a document this process has not seen yet. Chunks already stored in
+    its namespace (indexed before a restart) are not embedded again.
+    """
+    if settings.BM25_PREFILTER_TOP_M > 0:
+        document = PartialDocument(await _extract_chunks(doc_url, doc_type))
+        chunk_ids = [f"{doc_id}-{idx}" for idx in range(len(document.chunks))]
+        stored = await asyncio.to_thread(vector_client.existing_ids, chunk_ids, doc_id)
+        document.embedded.update(idx for idx, chunk_id in enumerate(chunk_ids) if chunk_id in stored)
+        return None if len(document.embedded) == len(document.chunks) else document
+
+    # A fully indexed document is upserted in one call, so its first chunk marks it
+    if not await asyncio.to_thread(vector_client.existing_ids, [f"{doc_id}-0"], doc_id):
+        await _index_document(doc_url, doc_type, doc_id)
+    return None
+
+
+async def _index_document(doc_url: str, doc_type: str, doc_id: str):
+    """Extract, chunk, embed and upsert a document into its own namespace."""
+    chunks: List[str] = []
+    embedding_tasks = []
+
+    def _embed_batch(batch: List[str]):
+        chunks.extend(batch)
+        embedding_tasks.append(asyncio.create_task(
+            get_embeddings_batch(batch, provider=settings.DEFAULT_EMBEDDING_PROVIDER)
+        ))
+
+    try:
+        # Steps 1-3: Parse pages, chunk them as they arrive and embed each full batch
+        # in the background, so embedding overlaps parsing of the following pages
+        batch = []
+        async for chunk in _iter_document_chunks(doc_url, doc_type):
+            batch.append(chunk)
+            if len(batch) == settings.EMBEDDING_BATCH_SIZE:
+                _embed_batch(batch)
+                batch = []
+        if batch:
+            _embed_batch(batch)
+
+        if not chunks:
+            raise HTTPException(status_code=422, detail="Failed to extract any text from the document.")
+
+        batch_embeddings = await asyncio.gather(*embedding_tasks)
+    except BaseException:
+        for task in embedding_tasks:
+            task.cancel()
+        raise
+
+    # Step 4: Upsert embeddings with metadata into vector DB
+    chunk_embeddings = [emb for embeddings in batch_embeddings for emb in embeddings]
+    vectors_to_upsert = []
+    for idx, emb in enumerate(chunk_embeddings):
+        vectors_to_upsert.append((f"{doc_id}-{idx}", emb, {"text": chunks[idx]}))
+    await vector_client.upsert_async(vectors_to_upsert, namespace=doc_id)
+
+
+def _iter_document_chunks(doc_url: str, doc_type: str):
+    """Stream a document's chunks, in token windows when a tokenizer is configured."""
+    encoding = get_encoding(settings.CHUNK_TOKENIZER) if settings.CHUNK_TOKENIZER else None
+    if encoding is not None:
+        return iter_chunks(iter_pages(doc_url, doc_type), size=settings.CHUNK_TOKEN_SIZE,
+                           overlap=settings.CHUNK_TOKEN_OVERLAP, encoding=encoding)
+    return iter_chunks(iter_pages(doc_url, doc_type), size=settings.CHUNK_SIZE, overlap=settings.CHUNK_OVERLAP)
+
+
+async def _extract_chunks(doc_url: str, doc_type: str) -> List[str]:
+    """Extract and chunk a document without embedding it."""
+    chunks = [chunk async for chunk in _iter_document_chunks(doc_url, doc_type)]
+    if not chunks:
+        raise HTTPException(status_code=422, detail="Failed to extract any text from the document.")
+    return chunks
+
+
+async def _index_candidates(document: PartialDocument, doc_id: str, questions: List[str]):
+    """Embed and upsert the not-yet-indexed chunks shortlisted by BM25 for the questions."""
+    candidates = document.keywords.candidates(questions, settings.BM25_PREFILTER_TOP_M)
+    missing = [idx for idx in candidates if idx not in document.embedded]
+    if not missing:
+        return
+
+    embeddings = await get_embeddings_batch(
+        [document.chunks[idx] for idx in missing],
+        provider=settings.DEFAULT_EMBEDDING_PROVIDER
+    )
+    await vector_client.upsert_async(
+        [(f"{doc_id}-{idx}", emb, {"text": document.chunks[idx]}) for idx, emb in zip(missing, embeddings)],
+        namespace=doc_id
+    )
+    document.embedded.update(missing)
+
+
 @router.get("/health")
 async def health_check():
     return {"status": "ok"}
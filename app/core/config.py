@@ -22,17 +22,34 @@ class Settings:
     # Vector Database Settings
     VECTOR_INDEX_NAME: str = os.getenv("VECTOR_INDEX_NAME", "policy-index")
     EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "768"))  # Gemini default
+    FAISS_INDEX_FACTORY: str = os.getenv("FAISS_INDEX_FACTORY", "SQ8")  # e.g. "Flat", "IVF256,PQ64"; "HNSW32,SQ8" only speeds up unscoped queries
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "1024"))  # cached FAISS queries; 0 disables the cache
+    INDEXED_DOCUMENTS_CACHE_SIZE: int = int(os.getenv("INDEXED_DOCUMENTS_CACHE_SIZE", "256"))  # documents whose index state is kept in memory
     
     # Document Processing Settings
+    DOWNLOAD_MEMORY_LIMIT: int = int(os.getenv("DOWNLOAD_MEMORY_LIMIT", str(32 * 1024 * 1024)))  # larger downloads spool to disk
+    PDF_PARSER: str = os.getenv("PDF_PARSER", "pdfium")  # "pdfium" (fast) or "pdfplumber" (layout-aware)
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))  # processes parsing large PDFs
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))  # smaller PDFs parse in one thread
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "300"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "50"))
+    CHUNK_TOKENIZER: str = os.getenv("CHUNK_TOKENIZER", "cl100k_base")  # tiktoken encoding; empty chunks by words
+    CHUNK_TOKEN_SIZE: int = int(os.getenv("CHUNK_TOKEN_SIZE", "512"))
+    CHUNK_TOKEN_OVERLAP: int = int(os.getenv("CHUNK_TOKEN_OVERLAP", "64"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # chunks per embedding call while parsing
     TOP_K_RESULTS: int = int(os.getenv("TOP_K_RESULTS", "5"))
+    BM25_PREFILTER_TOP_M: int = int(os.getenv("BM25_PREFILTER_TOP_M", "50"))  # chunks embedded per question; 0 embeds all
+    MAX_CONCURRENT_QUERIES: int = int(os.getenv("MAX_CONCURRENT_QUERIES", "4"))
     
     # LLM Settings
     DEFAULT_LLM_PROVIDER: str = os.getenv("DEFAULT_LLM_PROVIDER", "gemini")
     DEFAULT_EMBEDDING_PROVIDER: str = os.getenv("DEFAULT_EMBEDDING_PROVIDER", "gemini")
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "800"))
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.3"))
+    EXPLAIN_WITH_LLM: bool = os.getenv("EXPLAIN_WITH_LLM", "false").lower() == "true"  # LLM call per clause explanation
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))  # 0 disables the cache
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))  # Gemini requests in flight at once
+    GEMINI_RETRY_ATTEMPTS: int = int(os.getenv("GEMINI_RETRY_ATTEMPTS", "5"))  # tries per call on 429/5xx
     
     def validate(self):
         """Validate required environment variables"""
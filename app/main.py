@@ -7,8 +7,11 @@ from typing import List, Optional
 
 # Import configuration and routers
 from app.core.config import settings
-from app.api.endpoints import router as api_router
+from app.api.endpoints import router as api_router, vector_client
 from app.services.query_service import QueryService
+from app.services.embedding_engine import close_session
+from app.services.document_parser import shutdown_process_pool
+from app.services.vector_search import FAISSClient
 
 
 
@@ -35,6 +38,16 @@ query_service = QueryService()
 
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Release pooled provider connections and PDF parsing workers
+    await close_session()
+    shutdown_process_pool()
+    # Save FAISS vectors that are only in the upsert log so far
+    if isinstance(vector_client, FAISSClient) and vector_client.pending:
+        vector_client.flush()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome! Use POST /api/v1/hackrx/run to submit queries."}
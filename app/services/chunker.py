@@ -1,17 +1,124 @@
-from typing import List
+import functools
+import logging
+from typing import AsyncIterable, AsyncIterator, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    logger.warning("tiktoken not available, chunking by words")
+
+# Lookup table of every code point str.split() treats as whitespace (all are below
+# U+3001); higher code points are clamped onto the final, non-whitespace slot.
+_WHITESPACE_LUT = np.array([chr(c).isspace() for c in range(0x3002)], dtype=bool)
+_LUT_LAST = len(_WHITESPACE_LUT) - 1
+
+
+def _word_bounds(text: str):
+    """
+    Returns (starts, ends) character offsets of every whitespace-separated word.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    # ASCII whitespace is space, \t-\r and \x1c-\x1f (unsigned wrap-around keeps
+    # each range check to one comparison); the rare non-ASCII code points go
+    # through the lookup table.
+    is_space = codes == 32
+    is_space |= (codes - np.uint32(9)) <= 4
+    is_space |= (codes - np.uint32(28)) <= 3
+    non_ascii = np.flatnonzero(codes > 127)
+    if non_ascii.size:
+        is_space[non_ascii] = _WHITESPACE_LUT[np.minimum(codes[non_ascii], _LUT_LAST)]
+    # +1 where a word begins, -1 where a word ends (padding handles both string edges)
+    edges = np.diff(np.concatenate(([True], is_space, [True])).view(np.int8))
+    return np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)
+
 
 def chunk_text(text: str, size: int = 300, overlap: int = 50) -> List[str]:
     """
     Splits large text into overlapping word chunks for efficient retrieval.
+    Chunks are sliced straight out of the original text, so whitespace
+    inside a chunk is preserved as-is.
     """
-    words = text.split()
-    if not words:
+    if size <= overlap:
+        raise ValueError("size must be greater than overlap")
+    starts, ends = _word_bounds(text)
+    if not len(starts):
         return []
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = min(start + size, len(words))
-        chunk = words[start:end]
-        chunks.append(" ".join(chunk))
-        start += size - overlap
-    return chunks
+    first_words = np.arange(0, len(starts), size - overlap)
+    last_words = np.minimum(first_words + size, len(starts)) - 1
+    return [text[s:e] for s, e in zip(starts[first_words].tolist(), ends[last_words].tolist())]
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name: str):
+    """
+    Load a tiktoken encoding once. Returns None if tiktoken or the encoding
+    is unavailable, in which case callers fall back to word windows.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Failed to load tiktoken encoding '{name}', chunking by words: {e}")
+        return None
+
+
+def chunk_tokens(text: str, encoding, size: int = 512, overlap: int = 64) -> List[str]:
+    """
+    Splits text into overlapping windows of `size` tokens, so chunks match
+    what embedding/LLM APIs bill and truncate by.
+    """
+    if size <= overlap:
+        raise ValueError("size must be greater than overlap")
+    ids = encoding.encode_ordinary(text)
+    return [encoding.decode(ids[start:start + size]) for start in range(0, len(ids), size - overlap)]
+
+
+async def iter_chunks(pages: AsyncIterable[str], size: int = 300, overlap: int = 50,
+                      encoding=None) -> AsyncIterator[str]:
+    """
+    Chunks a stream of page texts as they arrive, yielding each chunk as soon
+    as its window is complete. Produces the same chunks as chunk_text() over
+    the pages joined with newlines, while only holding about one window of
+    text besides the current page. With a tiktoken `encoding`, windows are
+    `size` tokens instead of words (see chunk_tokens).
+    """
+    if size <= overlap:
+        raise ValueError("size must be greater than overlap")
+    if encoding is not None:
+        async for chunk in _iter_token_chunks(pages, encoding, size, overlap):
+            yield chunk
+        return
+
+    step = size - overlap
+    pending = ""
+    async for page in pages:
+        pending = f"{pending}\n{page}"
+        starts, ends = _word_bounds(pending)
+        first = 0
+        while len(starts) - first >= size:
+            yield pending[starts[first]:ends[first + size - 1]]
+            first += step
+        if first:
+            pending = pending[starts[first]:] if first < len(starts) else ""
+    for chunk in chunk_text(pending, size=size, overlap=overlap):
+        yield chunk
+
+
+async def _iter_token_chunks(pages: AsyncIterable[str], encoding, size: int, overlap: int) -> AsyncIterator[str]:
+    step = size - overlap
+    pending: List[int] = []
+    async for page in pages:
+        pending.extend(encoding.encode_ordinary(f"\n{page}" if pending else page))
+        first = 0
+        while len(pending) - first >= size:
+            yield encoding.decode(pending[first:first + size])
+            first += step
+        del pending[:first]
+    for start in range(0, len(pending), step):
+        yield encoding.decode(pending[start:start + size])
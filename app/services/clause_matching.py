@@ -0,0 +1,46 @@
+# app/services/clause_matching.py
+
+import re
+from typing import List
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class KeywordIndex:
+    """
+    BM25 keyword index over a document's chunks, used to shortlist the chunks
+    worth embedding for a set of questions.
+    """
+
+    def __init__(self, chunks: List[str]):
+        """
+        Args:
+            chunks (List[str]): Text chunks of the document.
+        """
+        self.size = len(chunks)
+        self.bm25 = BM25Okapi([_tokenize(chunk) for chunk in chunks])
+
+    def candidates(self, questions: List[str], top_m: int) -> List[int]:
+        """
+        Union of the top_m best BM25 matches of each question.
+
+        Args:
+            questions (List[str]): Natural language questions.
+            top_m (int): Number of chunks to keep per question.
+
+        Returns:
+            List[int]: Sorted chunk indices.
+        """
+        if top_m >= self.size:
+            return list(range(self.size))
+        selected = set()
+        for question in questions:
+            scores = self.bm25.get_scores(_tokenize(question))
+            selected.update(np.argpartition(scores, -top_m)[-top_m:].tolist())
+        return sorted(selected)
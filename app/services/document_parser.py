@@ -1,45 +1,232 @@
+import io
+import itertools
 import os
+import asyncio
+import hashlib
+import multiprocessing
 import tempfile
+import threading
 import requests
 import pdfplumber
+import pypdfium2 as pdfium
 from docx import Document
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Union
 from urllib.parse import urlparse
+from app.core.config import settings
 
+# Process pool for parsing large PDFs in parallel (see _get_process_pool)
+_process_pool: Optional[ProcessPoolExecutor] = None
 
-def _download_file(url: str) -> str:
+# PDFium is not thread-safe, even across documents, and pages are parsed in
+# worker threads; every call into it holds this lock (one per process)
+_pdfium_lock = threading.Lock()
+
+
+def fingerprint_document(url: str) -> str:
+    """
+    Compute a stable id for a remote document from its URL and its ETag or
+    Last-Modified header. Falls back to the URL alone if HEAD is not answered.
+    """
+    version = ""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=10)
+        if response.ok:
+            version = response.headers.get("ETag") or response.headers.get("Last-Modified") or ""
+    except requests.RequestException:
+        pass
+    return hashlib.blake2b(f"{url}|{version}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _download_file(url: str) -> Union[bytes, str]:
     """
-    Downloads a file from a URL to a temporary file, sanitizing the file suffix.
+    Downloads a file from a URL. Files up to settings.DOWNLOAD_MEMORY_LIMIT
+    bytes are returned in memory; larger ones are spooled to a temporary file
+    (with a sanitized suffix) whose path is returned instead.
     """
     response = requests.get(url, stream=True, timeout=30)
     response.raise_for_status()
 
+    parts = []
+    size = 0
+    content = response.iter_content(chunk_size=1 << 20)
+    for chunk in content:
+        parts.append(chunk)
+        size += len(chunk)
+        if size > settings.DOWNLOAD_MEMORY_LIMIT:
+            break
+    else:
+        return b"".join(parts)
+
     parsed_url = urlparse(url)
     path = parsed_url.path  # Extract only the path part without query parameters
     suffix = os.path.splitext(path)[-1] or ".tmp"
 
+    return _spool_to_file(itertools.chain(parts, content), suffix)
+
+
+def _spool_to_file(chunks: Iterable[bytes], suffix: str) -> str:
+    """Write chunks of bytes to a new temporary file and return its path."""
     fd, tmp_path = tempfile.mkstemp(suffix=suffix)
     with os.fdopen(fd, 'wb') as tmp:
-        for chunk in response.iter_content(chunk_size=8192):
+        for chunk in chunks:
             tmp.write(chunk)
-
     return tmp_path
 
 
+def _open_source(source: Union[bytes, str]):
+    """File-like object or path the parsers can open, for in-memory or spooled downloads."""
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _release_source(source: Union[bytes, str]):
+    """Remove the temporary file behind a spooled download."""
+    if isinstance(source, str):
+        os.remove(source)
+
+
+def _iter_pdf_pages(source: Union[bytes, str], parser: str, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of PDF pages [start, end) one page at a time.
+    """
+    if parser == "pdfplumber":
+        # Layout-aware but much slower; opt in for table-heavy documents
+        with pdfplumber.open(_open_source(source)) as pdf:
+            for page in pdf.pages[start:end]:
+                yield page.extract_text() or ""
+    else:
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(_open_source(source))
+            n_pages = len(pdf)
+        try:
+            # Held per page rather than across yields, so other documents can interleave
+            for index in range(start, n_pages if end is None else end):
+                with _pdfium_lock:
+                    page = pdf[index]
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_bounded()
+                    textpage.close()
+                    page.close()
+                yield text.replace("\r\n", "\n")
+        finally:
+            with _pdfium_lock:
+                pdf.close()
+
+
+def _extract_page_range(source: Union[bytes, str], parser: str, start: int, end: int) -> List[str]:
+    """
+    Process-pool worker: extract pages [start, end) with its own document handle
+    (PDF handles cannot be shared across processes).
+    """
+    return list(_iter_pdf_pages(source, parser, start, end))
+
+
+def _count_pdf_pages(source: Union[bytes, str]) -> int:
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(_open_source(source))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """
+    Shared process pool for CPU-bound PDF parsing, created on first use. Workers
+    are spawned rather than forked: a fork would copy locks (e.g. _pdfium_lock)
+    held by this process's other threads and leave them locked forever.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Stop the PDF parsing workers (called on application shutdown)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _iter_page_texts(source: Union[bytes, str], doc_type: str) -> Iterator[str]:
+    """
+    Yield the text of a downloaded document one page at a time.
+    DOCX files have no pages and are yielded as a single block.
+    """
+    if doc_type.lower() == "pdf":
+        yield from _iter_pdf_pages(source, settings.PDF_PARSER)
+    elif doc_type.lower() == "docx":
+        doc = Document(_open_source(source))
+        yield "\n".join(paragraph.text for paragraph in doc.paragraphs)
+    else:
+        raise NotImplementedError("Only PDF and DOCX parsing implemented.")
+
+
 def extract_text(doc_url: str, doc_type: str) -> str:
     """
     Extract raw text from a PDF or DOCX file provided by URL.
     Supports: PDF, DOCX.
     """
-    file_path = _download_file(doc_url)
+    source = _download_file(doc_url)
+    try:
+        return "\n".join(_iter_page_texts(source, doc_type))
+    finally:
+        _release_source(source)
+
+
+async def iter_pages(doc_url: str, doc_type: str) -> AsyncIterator[str]:
+    """
+    Asynchronously yield the text of a PDF or DOCX document page by page.
+    Download and parsing run off the event loop so it stays free to process
+    earlier pages while later ones are parsed. Large PDFs are split into page
+    ranges parsed in parallel by the process pool.
+    """
+    source = await asyncio.to_thread(_download_file, doc_url)
     try:
         if doc_type.lower() == "pdf":
-            with pdfplumber.open(file_path) as pdf:
-                text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-        elif doc_type.lower() == "docx":
-            doc = Document(file_path)
-            text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
-        else:
-            raise NotImplementedError("Only PDF and DOCX parsing implemented.")
-        return text
+            n_pages = await asyncio.to_thread(_count_pdf_pages, source)
+            if n_pages >= settings.PDF_PARALLEL_MIN_PAGES and settings.PDF_WORKERS > 1:
+                async for text in _iter_pdf_pages_parallel(source, n_pages):
+                    yield text
+                return
+
+        pages = _iter_page_texts(source, doc_type)
+        try:
+            while True:
+                text = await asyncio.to_thread(next, pages, None)
+                if text is None:
+                    break
+                yield text
+        finally:
+            pages.close()
+    finally:
+        _release_source(source)
+
+
+async def _iter_pdf_pages_parallel(source: Union[bytes, str], n_pages: int) -> AsyncIterator[str]:
+    """
+    Parse equal page ranges of a PDF in the process pool, yielding pages in order.
+    Workers open the PDF by path, so an in-memory download is written to a
+    temporary file once instead of being pickled to every worker.
+    """
+    path = source if isinstance(source, str) else await asyncio.to_thread(_spool_to_file, [source], ".pdf")
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    per_worker = -(-n_pages // settings.PDF_WORKERS)
+    futures = [
+        loop.run_in_executor(pool, _extract_page_range, path, settings.PDF_PARSER,
+                             start, min(start + per_worker, n_pages))
+        for start in range(0, n_pages, per_worker)
+    ]
+    try:
+        for future in futures:
+            for text in await future:
+                yield text
     finally:
-        os.remove(file_path)
+        for future in futures:
+            future.cancel()
+        if path is not source:
+            os.remove(path)
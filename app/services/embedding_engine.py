@@ -1,9 +1,15 @@
 import os
 import aiohttp
 import asyncio
+import hashlib
+import random
 import openai
-from typing import List, Optional
+import orjson
+import numpy as np
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
 from dotenv import load_dotenv
+from app.core.config import settings
 
 load_dotenv()
 
@@ -12,18 +18,143 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 
-# Initialize OpenAI client
+# Initialize OpenAI client (async, so embedding calls don't block the event loop)
 openai_client = None
 if OPENAI_API_KEY:
-    from openai import OpenAI
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    from openai import AsyncOpenAI
+    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 # Gemini Embedding API endpoint (corrected)
 GEMINI_EMBED_URL = "https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent"
 
+# Gemini batch embedding endpoint (up to GEMINI_BATCH_LIMIT texts per request)
+GEMINI_BATCH_EMBED_URL = "https://generativelanguage.googleapis.com/v1beta/models/embedding-001:batchEmbedContents"
+GEMINI_BATCH_LIMIT = 100
+
 # DeepSeek API endpoint
 DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
 
+# Request headers for JSON bodies pre-encoded with orjson
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Gemini replies worth retrying, and the jittered exponential backoff between tries
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_BACKOFF = 4.0
+
+# Shared HTTP session (connection pool) for all provider calls, created lazily
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Bound on in-flight Gemini requests, one per event loop like the session
+_gemini_semaphore: Optional[asyncio.Semaphore] = None
+_gemini_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """
+    Return the shared aiohttp session, so TCP/TLS connections are reused
+    across calls. A new session is created if the previous one was closed
+    or belongs to another event loop.
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=32, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    """Close the shared HTTP session (called on application shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _get_gemini_semaphore() -> asyncio.Semaphore:
+    global _gemini_semaphore, _gemini_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _gemini_semaphore is None or _gemini_semaphore_loop is not loop:
+        _gemini_semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        _gemini_semaphore_loop = loop
+    return _gemini_semaphore
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """
+    Seconds to wait before retrying: the server's Retry-After (capped at
+    RETRY_MAX_BACKOFF so a request never stalls for long), else full-jitter backoff.
+    """
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), RETRY_MAX_BACKOFF)
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    return random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def _post_gemini(url: str, payload: dict, api_name: str) -> dict:
+    """
+    POST a JSON payload to a Gemini endpoint and return the decoded reply.
+
+    At most settings.GEMINI_MAX_CONCURRENCY requests are in flight at once.
+    Rate-limit and server errors are retried up to settings.GEMINI_RETRY_ATTEMPTS
+    times in total; other errors raise immediately.
+    """
+    session = await _get_session()
+    body = orjson.dumps(payload)
+    attempts = max(settings.GEMINI_RETRY_ATTEMPTS, 1)
+    for attempt in range(attempts):
+        async with _get_gemini_semaphore():
+            async with session.post(url, data=body, headers=JSON_HEADERS) as resp:
+                if resp.status == 200:
+                    return orjson.loads(await resp.read())
+                error_text = await resp.text()
+                if resp.status not in RETRY_STATUSES or attempt == attempts - 1:
+                    raise Exception(f"{api_name} error {resp.status}: {error_text}")
+                delay = _retry_delay(attempt, resp.headers.get("Retry-After"))
+        # Back off outside the semaphore so other requests can use the slot
+        await asyncio.sleep(delay)
+
+
+# Embedding model used by each provider (part of the cache key)
+EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "gemini": "models/embedding-001",
+    "deepseek": "text-embedding-ada-002",
+}
+
+# In-process LRU cache of embeddings keyed by provider, model and text hash
+_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+
+
+def _cache_key(text: str, provider: str) -> str:
+    """Stable cache key for a text embedded by a given provider/model."""
+    model = EMBEDDING_MODELS.get(provider, "")
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{provider}:{model}:{digest}"
+
+
+def _cache_get(key: str) -> Optional[List[float]]:
+    embedding = _embedding_cache.get(key)
+    if embedding is not None:
+        _embedding_cache.move_to_end(key)
+    return embedding
+
+
+def _cache_put(key: str, embedding: List[float]):
+    if settings.EMBEDDING_CACHE_SIZE <= 0:
+        return
+    _embedding_cache[key] = embedding
+    _embedding_cache.move_to_end(key)
+    while len(_embedding_cache) > settings.EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+
 
 async def get_embedding(text: str, provider: str = "openai") -> List[float]:
     """
@@ -34,85 +165,169 @@ async def get_embedding(text: str, provider: str = "openai") -> List[float]:
         provider: "openai", "gemini", or "deepseek"
     
     Returns:
-        List of embedding floats
+        List of embedding floats, L2-normalized like every embedding returned by
+        this module (vector stores may rely on unit norm and skip normalizing)
     """
-    if provider == "openai" and openai_client:
-        response = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
-    
-    elif provider == "gemini" and GEMINI_API_KEY:
-        return await _get_gemini_embedding(text)
-    
-    elif provider == "deepseek" and DEEPSEEK_API_KEY:
-        return await _get_deepseek_embedding(text)
-    
-    else:
+    key = _cache_key(text, provider)
+    embedding = _cache_get(key)
+    if embedding is None:
+        embedding = await _embed_uncached(text, provider)
+        _cache_put(key, embedding)
+    return embedding
+
+
+async def _embed_uncached(text: str, provider: str) -> List[float]:
+    """Call the provider for a single L2-normalized embedding, bypassing the cache."""
+    embed = PROVIDER_DISPATCH.get(provider)
+    if embed is None:
         raise ValueError(f"Provider '{provider}' not available or API key missing")
+    return _normalize(await embed(text))
+
+
+def _normalize(embedding: List[float]) -> List[float]:
+    return _normalize_rows(np.asarray([embedding], dtype=np.float32))[0].tolist()
 
 
 async def get_embeddings_batch(texts: List[str], provider: str = "openai") -> List[List[float]]:
     """
     Generate embeddings for multiple texts in batch.
+
+    Cached texts are served locally; only the misses are sent to the provider
+    and the results are stitched back in the original order.
+    """
+    keys = [_cache_key(text, provider) for text in texts]
+    embeddings: List[Optional[List[float]]] = [_cache_get(key) for key in keys]
+
+    # Deduplicate misses so repeated texts in one batch are embedded once
+    missing = {}
+    for idx, (key, embedding) in enumerate(zip(keys, embeddings)):
+        if embedding is None and key not in missing:
+            missing[key] = idx
+
+    if missing:
+        fresh = await _embed_batch_uncached([texts[idx] for idx in missing.values()], provider)
+        for key, embedding in zip(missing, fresh):
+            _cache_put(key, embedding)
+        fetched = dict(zip(missing, fresh))
+        embeddings = [fetched[key] if embedding is None else embedding
+                      for key, embedding in zip(keys, embeddings)]
+
+    return embeddings
+
+
+async def _embed_batch_uncached(texts: List[str], provider: str) -> List[List[float]]:
+    """
+    Call the provider for a batch of embeddings, bypassing the cache.
+    Returned embeddings are L2-normalized.
     """
     if provider == "openai" and openai_client:
         # OpenAI supports batch processing
-        response = openai_client.embeddings.create(
+        response = await openai_client.embeddings.create(
             model="text-embedding-ada-002",
             input=texts
         )
-        return [item.embedding for item in response.data]
+        embeddings = [item.embedding for item in response.data]
+
+    elif provider == "gemini" and GEMINI_API_KEY:
+        # Gemini embeds up to GEMINI_BATCH_LIMIT texts per request
+        batches = [texts[i:i + GEMINI_BATCH_LIMIT] for i in range(0, len(texts), GEMINI_BATCH_LIMIT)]
+        results = await asyncio.gather(*[_get_gemini_embeddings_batch(batch) for batch in batches])
+        embeddings = [embedding for batch in results for embedding in batch]
     
     else:
         # For other providers, process one by one
-        tasks = [get_embedding(text, provider) for text in texts]
-        return await asyncio.gather(*tasks)
+        tasks = [_embed_uncached(text, provider) for text in texts]
+        embeddings = await asyncio.gather(*tasks)
+
+    return _normalize_rows(np.asarray(embeddings, dtype=np.float32)).tolist()
+
+
+def _normalize_rows(arr: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of an (N, D) float32 array; zero rows stay zero."""
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return arr / norms
+
+
+async def _get_openai_embedding(text: str) -> List[float]:
+    """Get embedding from OpenAI API"""
+    response = await openai_client.embeddings.create(
+        model="text-embedding-ada-002",
+        input=text
+    )
+    return response.data[0].embedding
 
 
 async def _get_gemini_embedding(text: str) -> List[float]:
     """Get embedding from Gemini API"""
-    async with aiohttp.ClientSession() as session:
-        url = f"{GEMINI_EMBED_URL}?key={GEMINI_API_KEY}"
-        payload = {
+    url = f"{GEMINI_EMBED_URL}?key={GEMINI_API_KEY}"
+    payload = {
+        "model": "models/embedding-001",
+        "content": {
+            "parts": [{
+                "text": text
+            }]
+        }
+    }
+    
+    data = await _post_gemini(url, payload, "Gemini Embedding API")
+    return data['embedding']['values']
+
+
+async def _get_gemini_embeddings_batch(texts: List[str]) -> List[List[float]]:
+    """Get embeddings for up to GEMINI_BATCH_LIMIT texts in one Gemini API call"""
+    url = f"{GEMINI_BATCH_EMBED_URL}?key={GEMINI_API_KEY}"
+    payload = {
+        "requests": [{
             "model": "models/embedding-001",
             "content": {
                 "parts": [{
                     "text": text
                 }]
             }
-        }
-        
-        async with session.post(url, json=payload) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Gemini Embedding API error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            return data['embedding']['values']
+        } for text in texts]
+    }
+    
+    data = await _post_gemini(url, payload, "Gemini Batch Embedding API")
+    return [embedding['values'] for embedding in data['embeddings']]
 
 
 async def _get_deepseek_embedding(text: str) -> List[float]:
     """Get embedding from DeepSeek API"""
-    async with aiohttp.ClientSession() as session:
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "text-embedding-ada-002",  # DeepSeek compatible model
-            "input": text
-        }
+    session = await _get_session()
+    headers = {
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": "text-embedding-ada-002",  # DeepSeek compatible model
+        "input": text
+    }
+    
+    async with session.post(f"{DEEPSEEK_BASE_URL}/embeddings", 
+                           data=orjson.dumps(payload), headers=headers) as resp:
+        if resp.status != 200:
+            error_text = await resp.text()
+            raise Exception(f"DeepSeek API error {resp.status}: {error_text}")
         
-        async with session.post(f"{DEEPSEEK_BASE_URL}/embeddings", 
-                               json=payload, headers=headers) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"DeepSeek API error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            return data['data'][0]['embedding']
+        data = orjson.loads(await resp.read())
+        return data['data'][0]['embedding']
+
+
+def _build_provider_dispatch() -> Dict[str, Callable[[str], Awaitable[List[float]]]]:
+    """Map each provider with a configured API key to its embedding call."""
+    dispatch = {}
+    if openai_client:
+        dispatch["openai"] = _get_openai_embedding
+    if GEMINI_API_KEY:
+        dispatch["gemini"] = _get_gemini_embedding
+    if DEEPSEEK_API_KEY:
+        dispatch["deepseek"] = _get_deepseek_embedding
+    return dispatch
+
+
+# Providers usable in this process, resolved once at import
+PROVIDER_DISPATCH = _build_provider_dispatch()
 
 
 # Text generation functions (keeping your existing Gemini chat functionality)
@@ -120,31 +335,31 @@ async def generate_gemini_response(prompt: str, max_tokens: int = 512, temperatu
     """Generate text response using Gemini"""
     gemini_chat_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
     
-    async with aiohttp.ClientSession() as session:
-        url = f"{gemini_chat_url}?key={GEMINI_API_KEY}"
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
-            }],
-            "generationConfig": {
-                "temperature": temperature,
-                "maxOutputTokens": max_tokens,
-                "candidateCount": 1
-            }
+    url = f"{gemini_chat_url}?key={GEMINI_API_KEY}"
+    payload = {
+        "contents": [{
+            "parts": [{
+                "text": prompt
+            }]
+        }],
+        "generationConfig": {
+            "temperature": temperature,
+            "maxOutputTokens": max_tokens,
+            "candidateCount": 1
         }
-        
-        async with session.post(url, json=payload) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Gemini API error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            return data['candidates'][0]['content']['parts'][0]['text']
+    }
+    
+    data = await _post_gemini(url, payload, "Gemini API")
+    return data['candidates'][0]['content']['parts'][0]['text']
 
 
-async def generate_gemini_responses(prompts: List[str], max_tokens: int = 512, temperature: float = 0.7) -> List[str]:
-    """Generate multiple text responses using Gemini"""
+async def generate_gemini_responses(prompts: List[str], max_tokens: int = 512, temperature: float = 0.7,
+                                    return_exceptions: bool = False) -> List[str]:
+    """
+    Generate multiple text responses using Gemini concurrently.
+
+    With return_exceptions=True a failed prompt yields its exception in place
+    of the response instead of failing the whole batch.
+    """
     tasks = [generate_gemini_response(p, max_tokens=max_tokens, temperature=temperature) for p in prompts]
-    return await asyncio.gather(*tasks)
+    return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
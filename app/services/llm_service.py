@@ -1,32 +1,20 @@
 import os
+import re
 import asyncio
 from typing import List
-from app.services.embedding_engine import generate_gemini_response
+from app.core.config import settings
+from app.services.embedding_engine import generate_gemini_response, generate_gemini_responses
 from app.models.schemas import Clause
 
 
-async def generate_intelligent_answer(question: str, relevant_chunks: List[str], provider: str = "gemini") -> tuple[str, str]:
-    """
-    Generate an intelligent answer using LLM based on question and relevant document chunks.
-    
-    Args:
-        question: User's question
-        relevant_chunks: List of relevant text chunks from document
-        provider: LLM provider ("gemini" or "deepseek")
-    
-    Returns:
-        Tuple of (answer, rationale)
-    """
-    # Combine relevant chunks into context
-    context = "\n\n".join([f"Chunk {i+1}:\n{chunk}" for i, chunk in enumerate(relevant_chunks)])
-    
-    prompt = f"""
+# Fixed parts of the answer prompt, built once at import
+ANSWER_PROMPT_HEAD = """
 Based on the following document excerpts, please provide a comprehensive answer to the question.
 
 DOCUMENT EXCERPTS:
-{context}
+"""
 
-QUESTION: {question}
+ANSWER_PROMPT_TAIL = """
 
 Instructions:
 1. Provide a direct, accurate answer based only on the information in the document excerpts
@@ -37,6 +25,23 @@ Instructions:
 ANSWER:
 """
 
+
+async def generate_intelligent_answer(question: str, relevant_chunks: List[str], provider: str = "gemini") -> tuple[str, str]:
+    """
+    Generate an intelligent answer using LLM based on question and relevant document chunks.
+    
+    Args:
+        question: User's question
+        relevant_chunks: List of relevant text chunks from document
+        provider: LLM provider ("gemini" or "deepseek")
+    
+    Returns:
+        Tuple of (answer, rationale)
+    """
+    # Only the excerpts and the question vary; the instructions are fixed
+    context = "\n\n".join(relevant_chunks)
+    prompt = f"{ANSWER_PROMPT_HEAD}{context}\n\nQUESTION: {question}{ANSWER_PROMPT_TAIL}"
+
     if provider == "gemini":
         response = await generate_gemini_response(prompt, max_tokens=800, temperature=0.3)
     else:
@@ -63,11 +68,15 @@ async def create_clause_explanations(chunks: List[str], scores: List[float], que
     Returns:
         List of Clause objects with explanations
     """
-    clauses = []
-    
-    for i, (chunk, score) in enumerate(zip(chunks, scores)):
-        # Generate explanation for why this chunk is relevant
-        explanation_prompt = f"""
+    if not settings.EXPLAIN_WITH_LLM:
+        # Cheap local explanation: similarity score plus the terms shared with the question
+        return [
+            Clause(text=chunk, explanation=_template_explanation(score, chunk, question))
+            for chunk, score in zip(chunks, scores)
+        ]
+
+    def explanation_prompt_for(chunk: str) -> str:
+        return f"""
 Explain in 1-2 sentences why this document excerpt is relevant to the question: "{question}"
 
 Document excerpt:
@@ -75,17 +84,40 @@ Document excerpt:
 
 Keep the explanation concise and specific.
 """
-        
-        try:
-            explanation = await generate_gemini_response(explanation_prompt, max_tokens=150, temperature=0.2)
-            explanation = f"Relevance score: {score:.3f} - {explanation.strip()}"
-        except Exception:
-            # Fallback explanation if LLM fails
-            explanation = f"Semantic similarity score: {score:.3f} - This section contains content related to your query."
-        
-        clauses.append(Clause(
-            text=chunk,
-            explanation=explanation
-        ))
-    
-    return clauses
+
+    # Ask for all explanations at once; failures come back as exceptions
+    prompts = [explanation_prompt_for(chunk) for chunk in chunks]
+    responses = await generate_gemini_responses(prompts, max_tokens=150, temperature=0.2, return_exceptions=True)
+
+    return [
+        Clause(text=chunk, explanation=_format_explanation(score, response))
+        for chunk, score, response in zip(chunks, scores, responses)
+    ]
+
+
+def _format_explanation(score: float, response) -> str:
+    """Build the clause explanation, falling back to a generic one if the LLM call failed."""
+    if isinstance(response, BaseException):
+        return f"Semantic similarity score: {score:.3f} - This section contains content related to your query."
+    return f"Relevance score: {score:.3f} - {response.strip()}"
+
+
+# Words too common to be worth citing as shared terms
+_STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it of on or
+that the this to under was what when where which who why will with
+""".split())
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _template_explanation(score: float, chunk: str, question: str) -> str:
+    """Explain a clause's relevance without an LLM call."""
+    chunk_words = set(_WORD_RE.findall(chunk.lower()))
+    shared = []
+    for word in _WORD_RE.findall(question.lower()):
+        if word in chunk_words and word not in _STOPWORDS and word not in shared:
+            shared.append(word)
+    if not shared:
+        return f"Semantic similarity score: {score:.3f} - This section contains content related to your query."
+    return f"Relevance score: {score:.3f} - Shares the terms {', '.join(shared[:8])} with the question."
@@ -1,13 +1,29 @@
 # app/services/vector_search.py
 
 import os
-from typing import List, Dict, Optional, Union
+import asyncio
+import functools
+import itertools
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Union
 import logging
 import numpy as np
-import json
+import orjson
+from app.utils.helpers import ReadWriteLock
 
 logger = logging.getLogger(__name__)
 
+# Pinecone accepts up to about 100 vectors per upsert request
+PINECONE_UPSERT_BATCH = 100
+# Worker threads of the HTTP index handle that run async_req requests
+PINECONE_POOL_THREADS = 30
+
+# Smallest slice of rows worth scanning in its own thread for exact search
+FLAT_SHARD_MIN_ROWS = 16384
+
 try:
     from pinecone import Pinecone, ServerlessSpec
     PINECONE_AVAILABLE = True
@@ -15,14 +31,53 @@ except ImportError:
     PINECONE_AVAILABLE = False
     logger.warning("Pinecone not available, using FAISS fallback")
 
+try:
+    # HTTP/2 transport, installed with pinecone-client[grpc]
+    from pinecone.grpc import PineconeGRPC
+    PINECONE_GRPC_AVAILABLE = True
+except ImportError:
+    PINECONE_GRPC_AVAILABLE = False
+
+
+def _faiss_thread_budget() -> int:
+    """
+    OpenMP threads for FAISS: FAISS_NUM_THREADS if set, otherwise half of the
+    CPUs this process may run on, leaving the rest to the event loop and workers.
+    """
+    configured = int(os.getenv("FAISS_NUM_THREADS", "0"))
+    if configured > 0:
+        return configured
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, cpus // 2)
+
+
+FAISS_NUM_THREADS = _faiss_thread_budget()
+
 try:
     import faiss
+    faiss.omp_set_num_threads(FAISS_NUM_THREADS)
     FAISS_AVAILABLE = True
 except ImportError:
     FAISS_AVAILABLE = False
     logger.warning("FAISS not available")
 
 
+# Process-wide Pinecone clients (per API key) and index handles (per index name)
+_pinecone_clients: Dict[str, "Pinecone"] = {}
+_pinecone_indexes: Dict[str, object] = {}
+_pinecone_lock = threading.Lock()
+
+
+def _get_pinecone(api_key: str):
+    """Shared Pinecone client for an API key, preferring the gRPC transport."""
+    with _pinecone_lock:
+        pc = _pinecone_clients.get(api_key)
+        if pc is None:
+            pc = (PineconeGRPC if PINECONE_GRPC_AVAILABLE else Pinecone)(api_key=api_key)
+            _pinecone_clients[api_key] = pc
+        return pc
+
+
 class PineconeClient:
     """
     Wrapper class for Pinecone Vector DB operations: initialization, upsert, and query.
@@ -43,42 +98,110 @@ class PineconeClient:
         if not api_key:
             raise ValueError("PINECONE_API_KEY must be set")
 
-        self.pc = Pinecone(api_key=api_key)
+        self.pc = _get_pinecone(api_key)
         self.index_name = index_name
 
-        # Check if index exists
-        existing_indexes = [index.name for index in self.pc.list_indexes()]
-        if index_name not in existing_indexes:
-            # Create index with serverless spec
-            self.pc.create_index(
-                name=index_name,
-                dimension=1536,  # Dimension for text-embedding-ada-002 or similar
-                metric='cosine',
-                spec=ServerlessSpec(
-                    cloud='aws',
-                    region='us-west-2'
-                )
-            )
-            logger.info(f"Created new Pinecone index: {index_name}")
+        with _pinecone_lock:
+            self.index = _pinecone_indexes.get(index_name)
+            if self.index is None:
+                # Check if index exists
+                existing_indexes = [index.name for index in self.pc.list_indexes()]
+                if index_name not in existing_indexes:
+                    # Create index with serverless spec
+                    self.pc.create_index(
+                        name=index_name,
+                        dimension=1536,  # Dimension for text-embedding-ada-002 or similar
+                        metric='cosine',
+                        spec=ServerlessSpec(
+                            cloud='aws',
+                            region='us-west-2'
+                        )
+                    )
+                    logger.info(f"Created new Pinecone index: {index_name}")
 
-        self.index = self.pc.Index(index_name)
-        logger.info(f"Pinecone index initialized: {index_name}")
+                if PINECONE_GRPC_AVAILABLE:
+                    index = self.pc.Index(index_name)
+                else:
+                    index = self.pc.Index(index_name, pool_threads=PINECONE_POOL_THREADS)
+                self.index = _pinecone_indexes[index_name] = index
+                logger.info(f"Pinecone index initialized: {index_name}")
 
-    def upsert(self, vectors: List[tuple]):
+    def upsert(self, vectors: Iterable[tuple], namespace: Optional[str] = None):
         """
-        Upsert vectors into Pinecone index.
+        Upsert vectors into Pinecone index. The vectors are consumed in 100-vector
+        batches sent with async_req, so a generator is streamed without being
+        materialized; at most PINECONE_POOL_THREADS batches are held in flight.
 
         Args:
-            vectors (List[tuple]): List of tuples (id:str, embedding:List[float], metadata:dict).
+            vectors (Iterable[tuple]): Tuples (id:str, embedding:List[float], metadata:dict).
+            namespace (str): Namespace to upsert into (default namespace if None).
+        """
+        in_flight = deque()
+        count = batches = 0
+        for batch in self._batches(vectors):
+            if len(in_flight) >= PINECONE_POOL_THREADS:
+                self._wait(in_flight.popleft())
+            in_flight.append(self.index.upsert(vectors=batch, namespace=namespace or "", async_req=True))
+            count += len(batch)
+            batches += 1
+        while in_flight:
+            self._wait(in_flight.popleft())
+        logger.debug(f"Upserted {count} vectors to Pinecone in {batches} batches")
+
+    async def upsert_async(self, vectors: Iterable[tuple], namespace: Optional[str] = None):
+        """
+        Same as upsert(), waiting for the batches in a worker thread so the
+        event loop is not blocked.
+
+        Args:
+            vectors (Iterable[tuple]): Tuples (id:str, embedding:List[float], metadata:dict).
+            namespace (str): Namespace to upsert into (default namespace if None).
         """
-        # Batch limit is usually 100 vectors per upsert @ Pinecone, chunk if needed
-        chunk_size = 100
-        for i in range(0, len(vectors), chunk_size):
-            batch = vectors[i:i+chunk_size]
-            self.index.upsert(vectors=batch)
-            logger.debug(f"Upserted batch of {len(batch)} vectors to Pinecone")
+        await asyncio.to_thread(self.upsert, vectors, namespace)
 
-    def query(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True) -> List[Dict]:
+    def upsert_arrays(self, ids: List[str], embeddings: np.ndarray, metadatas: List[dict],
+                      namespace: Optional[str] = None):
+        """
+        Same as upsert(), with the vectors given as parallel arrays.
+
+        Args:
+            ids (List[str]): Vector IDs.
+            embeddings (np.ndarray): (n, dimension) embeddings.
+            metadatas (List[dict]): Metadata of each vector.
+            namespace (str): Namespace to upsert into (default namespace if None).
+        """
+        self.upsert(zip(ids, np.asarray(embeddings, dtype=np.float32).tolist(), metadatas), namespace)
+
+    def existing_ids(self, ids: List[str], namespace: Optional[str] = None) -> Set[str]:
+        """
+        The given vector IDs already stored in a namespace.
+
+        Args:
+            ids (List[str]): Vector IDs to look for.
+            namespace (str): Namespace to look in (default namespace if None).
+
+        Returns:
+            Set[str]: The IDs that were found.
+        """
+        found = set()
+        for batch in self._batches(ids):
+            response = self.index.fetch(ids=batch, namespace=namespace or "")
+            found.update(response['vectors'])
+        return found
+
+    @staticmethod
+    def _batches(vectors: Iterable[tuple]) -> Iterator[List[tuple]]:
+        it = iter(vectors)
+        while batch := list(itertools.islice(it, PINECONE_UPSERT_BATCH)):
+            yield batch
+
+    @staticmethod
+    def _wait(future):
+        # HTTP handles return an AsyncResult, gRPC handles a concurrent.futures.Future
+        return future.get() if hasattr(future, "get") else future.result()
+
+    def query(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True,
+              namespace: Optional[str] = None) -> List[Dict]:
         """
         Query the Pinecone index to find top_k similar vectors.
 
@@ -86,6 +209,7 @@ class PineconeClient:
             embedding (List[float]): Query embedding vector.
             top_k (int): Number of top results to return.
             include_metadata (bool): Whether to include metadata in results.
+            namespace (str): Namespace to search (default namespace if None).
 
         Returns:
             List[Dict]: List of matching items with 'id', 'score', and optionally 'metadata'.
@@ -93,77 +217,484 @@ class PineconeClient:
         response = self.index.query(
             vector=embedding,
             top_k=top_k,
-            include_metadata=include_metadata
+            include_metadata=include_metadata,
+            namespace=namespace or ""
         )
         return response['matches']
 
+    def query_batch(self, embeddings: List[List[float]], top_k: int = 5, include_metadata: bool = True,
+                    namespace: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Query the Pinecone index for several embeddings, sending the requests
+        concurrently from a thread pool.
+
+        Args:
+            embeddings (List[List[float]]): Query embedding vectors.
+            top_k (int): Number of top results to return per query.
+            include_metadata (bool): Whether to include metadata in results.
+            namespace (str): Namespace to search (default namespace if None).
+
+        Returns:
+            List[List[Dict]]: Matches for each query, in the order of `embeddings`.
+        """
+        if not embeddings:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(embeddings), 16)) as pool:
+            return list(pool.map(
+                lambda embedding: self.query(embedding, top_k=top_k, include_metadata=include_metadata,
+                                             namespace=namespace),
+                embeddings
+            ))
+
+    async def query_async(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True,
+                          namespace: Optional[str] = None) -> List[Dict]:
+        """
+        Same as query(), run in a worker thread so the event loop is not blocked.
+        """
+        return await asyncio.to_thread(self.query, embedding, top_k, include_metadata, namespace)
+
+    async def query_batch_async(self, embeddings: List[List[float]], top_k: int = 5,
+                                include_metadata: bool = True,
+                                namespace: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Same as query_batch(), run in a worker thread so the event loop is not blocked.
+        """
+        return await asyncio.to_thread(self.query_batch, embeddings, top_k, include_metadata, namespace)
+
+
+class SimilarityCache:
+    """
+    Cache of recent query results that can answer a new query falling inside
+    the "hyperball" of a cached one.
+
+    With unit vectors and Euclidean distance d, a cached query a whose k-th
+    result lies at distance r_a covers every stored vector within r_a of a. For
+    a new query b at distance delta = d(a, b), every vector within r_a - delta of
+    b lies in that ball, so the cached results that close to b are exactly its
+    nearest neighbours; if there are at least top_k of them the index is not
+    searched. This only holds for results of exact searches, so approximate
+    (HNSW/IVF) results must not be inserted. Entries are evicted oldest first.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Args:
+            capacity (int): Maximum number of cached queries.
+        """
+        self.capacity = capacity
+        self._entries: Dict[Optional[str], list] = {}  # namespace -> cache entries
+        self._order = deque()  # (namespace, entry) in insertion order
+        self._lock = threading.Lock()
+
+    def lookup(self, query: np.ndarray, top_k: int, namespace: Optional[str],
+               include_metadata: bool = True) -> Optional[List[Dict]]:
+        """
+        Matches for a normalized query from the closest cached query of the same
+        namespace, or None if the cache cannot guarantee them.
+        """
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if not entries:
+                return None
+            sims = np.array([entry[0] @ query for entry in entries])
+            _, vectors, matches, radius = entries[int(np.argmax(sims))]
+        delta = np.sqrt(max(0.0, 2.0 - 2.0 * float(sims.max())))
+
+        scores = vectors @ query
+        dists = np.sqrt(np.maximum(0.0, 2.0 - 2.0 * scores))
+        inside = np.flatnonzero(dists <= radius - delta + 1e-6)
+        if len(inside) < min(top_k, len(matches) if np.isinf(radius) else top_k):
+            return None
+
+        top = inside[np.argsort(-scores[inside], kind="stable")][:top_k]
+        results = []
+        for i in top.tolist():
+            match = {'id': matches[i]['id'], 'score': float(scores[i])}
+            if include_metadata and 'metadata' in matches[i]:
+                match['metadata'] = matches[i]['metadata']
+            results.append(match)
+        return results
+
+    def insert(self, query: np.ndarray, namespace: Optional[str], matches: List[Dict],
+               vectors: np.ndarray, top_k: int, exhaustive: bool = False):
+        """
+        Cache the exact matches of a normalized query along with the (normalized)
+        vectors they refer to, in match order. `exhaustive` means every vector in
+        the searched scope was returned; other results shorter than top_k are
+        not cached.
+        """
+        if self.capacity <= 0:
+            return
+        if exhaustive:
+            # Every vector the query can reach was returned
+            radius = np.inf
+        elif len(matches) < top_k:
+            return
+        else:
+            radius = float(np.sqrt(max(0.0, 2.0 - 2.0 * matches[-1]['score'])))
+        entry = (query.copy(), vectors, matches, radius)
+        with self._lock:
+            self._entries.setdefault(namespace, []).append(entry)
+            self._order.append((namespace, entry))
+            while len(self._order) > self.capacity:
+                old_namespace, old_entry = self._order.popleft()
+                self._entries[old_namespace].remove(old_entry)
+
+    def invalidate(self, namespace: Optional[str]):
+        """
+        Drop cached queries that new vectors in `namespace` could change (that
+        namespace and unscoped queries over the whole index).
+        """
+        with self._lock:
+            stale = {namespace, None}
+            for key in stale:
+                self._entries.pop(key, None)
+            self._order = deque(item for item in self._order if item[0] not in stale)
+
 
 class FAISSClient:
     """
     Local FAISS vector database for development and testing.
     """
     
-    def __init__(self, index_name: str = "policy-index", dimension: int = 1536):
+    def __init__(self, index_name: str = "policy-index", dimension: int = 1536,
+                 index_factory: str = "SQ8", ef_search: int = 64, nprobe: int = 16,
+                 flush_every: int = 10000, query_cache_size: int = 0, train_size: int = 10000,
+                 search_threads: int = FAISS_NUM_THREADS, assume_normalized: bool = False):
         """
         Initialize FAISS index.
         
         Args:
             index_name (str): Name of the index (used for local file storage).
             dimension (int): Vector dimension.
+            index_factory (str): FAISS index_factory description used for a new index,
+                e.g. "SQ8" (int8 codes), "Flat" (fp32), "IVF256,PQ64" (compressed) or
+                "HNSW32,SQ8" (graph search over int8 codes). Namespaced queries always
+                scan their namespace's rows exactly, so a graph (HNSW) only pays off for
+                unscoped queries and otherwise just slows down every upsert. Index
+                types that need training (SQ8, IVF, PQ) start out as an exact index and
+                are rebuilt once train_size vectors are stored.
+            ef_search (int): HNSW search depth (recall/speed trade-off).
+            nprobe (int): Number of IVF lists visited per query.
+            flush_every (int): Number of logged vectors after which upsert() rewrites
+                the index file (see flush()).
+            query_cache_size (int): Number of recent queries kept in a SimilarityCache
+                (0 disables it).
+            train_size (int): Number of vectors to collect before training the index
+                (at least 256 per IVF list/PQ centroid).
+            search_threads (int): Threads scanning shards of exact searches in parallel.
+            assume_normalized (bool): Stored and query embeddings are already unit
+                length (as returned by the embedding engine), so they are used as-is
+                instead of being L2-normalized again.
         """
         self.index_name = index_name
         self.dimension = dimension
+        self.index_factory = index_factory
+        self.train_size = train_size
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.assume_normalized = assume_normalized
+        self.flush_every = flush_every
         self.index_file = f"{index_name}.faiss"
+        # SQLite store of FAISS index -> original vector ID and metadata
+        self.db_file = f"{index_name}.db"
+        # JSON files used by older versions, imported into the SQLite store
         self.metadata_file = f"{index_name}_metadata.json"
         self.id_mapping_file = f"{index_name}_id_mapping.json"
+        self.namespaces_file = f"{index_name}_namespaces.json"
+        # Append-only log of upserts since the last flush: raw float32 rows plus one
+        # JSON line per upsert with its start position, size and namespace
+        self.vector_log_file = f"{index_name}_vectors.log"
+        self.upsert_log_file = f"{index_name}_upserts.jsonl"
+        self.pending = 0  # vectors logged but not yet in the saved index
+        self._local = threading.local()  # per-thread reusable query buffer
+        # Searches share the live index and only wait for upserts to swap in a new one;
+        # upserts and flushes are serialized by the write lock
+        self._lock = ReadWriteLock()
+        self._write_lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self.query_cache = SimilarityCache(query_cache_size) if query_cache_size > 0 else None
+        self.search_threads = max(1, search_threads)
+        self._search_pool = ThreadPoolExecutor(max_workers=self.search_threads) if self.search_threads > 1 else None
         
         # Initialize or load index
         if os.path.exists(self.index_file):
             self.index = faiss.read_index(self.index_file)
-            with open(self.metadata_file, 'r') as f:
-                self.metadata = json.load(f)
-            with open(self.id_mapping_file, 'r') as f:
-                self.id_mapping = json.load(f)
+            # Indexes saved before index_factory was configurable are brute-force
+            if (isinstance(self.index, faiss.IndexFlat) and index_factory != "Flat"
+                    and self.index.metric_type == faiss.METRIC_INNER_PRODUCT):
+                self.index = self._rebuild_index(self.index, index_factory)
+            if isinstance(self.index, faiss.IndexIVF) and self.index.direct_map.type == faiss.DirectMap.NoMap:
+                self.index.make_direct_map()
             logger.info(f"Loaded existing FAISS index: {index_name}")
         else:
-            self.index = faiss.IndexFlatIP(dimension)  # Inner product similarity
-            self.metadata = {}
-            self.id_mapping = {}  # Maps FAISS index -> original vector ID
+            self.index = self._build_index(dimension, index_factory)
+            if not self.index.is_trained:
+                # Collect vectors in an exact index until there are enough to train on
+                self.index = faiss.IndexFlatIP(dimension)
             logger.info(f"Created new FAISS index: {index_name}")
+        # The metadata store and the original vector ID of each FAISS index are
+        # loaded on first use (see _open_store)
+        self.db: Optional[sqlite3.Connection] = None
+        self._ids: Optional[np.ndarray] = None
+
+        # Maps namespace -> list of [start, end) ranges of FAISS indices holding its vectors
+        self.namespaces = {}
+        if os.path.exists(self.namespaces_file):
+            with open(self.namespaces_file, 'rb') as f:
+                self.namespaces = orjson.loads(f.read())
+        self._replay_log()
+
+    def _open_store(self):
+        """
+        Open the metadata store and load the vector IDs on first upsert or query,
+        so creating a client (e.g. at import time) writes no files.
+        """
+        if self.db is not None:
+            return
+        with self._store_lock:
+            if self.db is None:
+                db = self._connect_metadata_store()
+                self._ids = self._load_ids(db)
+                self.db = db
     
-    def upsert(self, vectors: List[tuple]):
+    def _connect_metadata_store(self) -> sqlite3.Connection:
+        """
+        Open the SQLite metadata store, importing the JSON files written by
+        older versions on first use.
+        """
+        db = sqlite3.connect(self.db_file, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS vectors ("
+                   "faiss_idx INTEGER PRIMARY KEY, original_id TEXT NOT NULL, metadata BLOB)")
+        is_empty = db.execute("SELECT 1 FROM vectors LIMIT 1").fetchone() is None
+        if is_empty and os.path.exists(self.id_mapping_file):
+            with open(self.id_mapping_file, 'rb') as f:
+                id_mapping = orjson.loads(f.read())
+            metadata = {}
+            if os.path.exists(self.metadata_file):
+                with open(self.metadata_file, 'rb') as f:
+                    metadata = orjson.loads(f.read())
+            db.executemany(
+                "INSERT INTO vectors VALUES (?, ?, ?)",
+                [(int(idx), vector_id, orjson.dumps(metadata[vector_id]) if vector_id in metadata else None)
+                 for idx, vector_id in id_mapping.items()]
+            )
+            db.commit()
+            logger.info(f"Imported {len(id_mapping)} JSON metadata entries into {self.db_file}")
+        return db
+
+    @staticmethod
+    def _build_index(dimension: int, index_factory: str):
+        """
+        Build an empty inner-product index (cosine on normalized vectors).
+        """
+        index = faiss.index_factory(dimension, index_factory, faiss.METRIC_INNER_PRODUCT)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = 200
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()  # namespace searches reconstruct rows by position
+        return index
+
+    def _rebuild_index(self, flat_index, index_factory: str):
+        """
+        Move the vectors of a brute-force index (saved by an older version, or
+        collecting vectors until train_size are stored) into a new index_factory
+        index, keeping their positions (and so the ID mapping and namespace ranges).
+        The flat index is kept while it holds fewer than train_size vectors for an
+        index that needs training, or if training fails. The rebuilt index is saved
+        by the next flush().
+        """
+        index = self._build_index(flat_index.d, index_factory)
+        if not index.is_trained and flat_index.ntotal < self.train_size:
+            return flat_index
+        if flat_index.ntotal:
+            vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+            if not index.is_trained:
+                try:
+                    index.train(vectors[:self.train_size])
+                except RuntimeError as e:
+                    logger.warning(f"Keeping flat FAISS index, cannot train '{index_factory}': {e}")
+                    return flat_index
+            index.add(vectors)
+        elif not index.is_trained:
+            return flat_index
+        logger.info(f"Rebuilt flat FAISS index {self.index_name} as '{index_factory}'")
+        return index
+
+    def _search_params(self):
+        """
+        Search parameters matching the index type.
+        """
+        if isinstance(self.index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=self.ef_search)
+        if isinstance(self.index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=self.nprobe)
+        return None
+
+    def upsert(self, vectors: List[tuple], namespace: Optional[str] = None):
         """
         Upsert vectors into FAISS index.
+
+        The vectors are added to a copy of the index that then replaces the live
+        one, so searches keep running meanwhile, and are searchable as soon as
+        upsert() returns. Their metadata is written to the SQLite store, while
+        the vectors are only appended to the upsert log; the
+        index file is rewritten by flush(), which runs automatically once
+        flush_every vectors are pending.
         
         Args:
             vectors (List[tuple]): List of tuples (id:str, embedding:List[float], metadata:dict).
+            namespace (str): Namespace the vectors belong to. Each upsert stores its
+                vectors as one contiguous range so queries can be scoped to it.
         """
-        embeddings = []
-        start_idx = self.index.ntotal  # Current size of index
-        
-        for i, (vector_id, embedding, metadata) in enumerate(vectors):
-            embeddings.append(embedding)
-            self.metadata[vector_id] = metadata
-            # Map FAISS index to original vector ID
-            self.id_mapping[str(start_idx + i)] = vector_id
-        
-        # Convert to numpy array and normalize for cosine similarity
-        embeddings_np = np.array(embeddings, dtype=np.float32)
-        faiss.normalize_L2(embeddings_np)  # Normalize for cosine similarity
-        
-        # Add to index
-        self.index.add(embeddings_np)
+        if not vectors:
+            return
+        ids, embeddings, metadatas = zip(*vectors)
+        self.upsert_arrays(list(ids), np.array(embeddings, dtype=np.float32), metadatas, namespace)
+
+    def upsert_arrays(self, ids: List[str], embeddings: np.ndarray, metadatas: List[dict],
+                      namespace: Optional[str] = None):
+        """
+        Same as upsert(), with the vectors given as parallel arrays so no per-vector
+        tuples are built. A float32 C-contiguous embeddings array is normalized in
+        place and added without copying.
+
+        Args:
+            ids (List[str]): Vector IDs.
+            embeddings (np.ndarray): (n, dimension) embeddings.
+            metadatas (List[dict]): Metadata of each vector.
+            namespace (str): Namespace the vectors belong to.
+        """
+        if not len(ids):
+            return
+        if isinstance(ids, np.ndarray):
+            ids = ids.tolist()
+        embeddings_np = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if not self.assume_normalized:
+            faiss.normalize_L2(embeddings_np)  # Normalize for cosine similarity
+        self._open_store()
+        with self._write_lock:
+            start_idx = self.index.ntotal
+            self.db.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                [(start_idx + i, vector_id, orjson.dumps(metadata))
+                 for i, (vector_id, metadata) in enumerate(zip(ids, metadatas))]
+            )
+            self.db.commit()
+
+            # Add to a background copy while searches keep using the live index, then swap
+            namespaces = dict(self.namespaces)
+            index = self._add(faiss.clone_index(self.index), namespaces, embeddings_np, namespace)
+            all_ids = np.concatenate([self._ids, np.array(ids, dtype=object)])
+            with self._lock.write():
+                self.index = index
+                self.namespaces = namespaces
+                self._ids = all_ids
+            if self.query_cache is not None:
+                self.query_cache.invalidate(namespace)
+
+            # Vectors go first: a log entry is only replayed if all its rows were written
+            with open(self.vector_log_file, 'ab') as f:
+                f.write(embeddings_np.tobytes())
+            with open(self.upsert_log_file, 'ab') as f:
+                f.write(orjson.dumps({"start": start_idx, "count": len(ids), "namespace": namespace}) + b"\n")
+            self.pending += len(ids)
         
-        # Save index and metadata
+            logger.debug(f"Upserted {len(ids)} vectors to FAISS index")
+            if self.pending >= self.flush_every:
+                self._flush()
+
+    def _add(self, index, namespaces: Dict[str, List[List[int]]], embeddings_np: np.ndarray,
+             namespace: Optional[str]):
+        """
+        Add normalized vectors to an index and a namespace map, replacing the
+        namespace's list of ranges rather than changing it in place. Returns the
+        index, which is rebuilt once it holds enough vectors to train on.
+        """
+        start_idx = index.ntotal  # Current size of index
+        index.add(embeddings_np)
+        if namespace is not None:
+            ranges = [list(bounds) for bounds in namespaces.get(namespace, [])]
+            if ranges and ranges[-1][1] == start_idx:
+                ranges[-1][1] = start_idx + len(embeddings_np)
+            else:
+                ranges.append([start_idx, start_idx + len(embeddings_np)])
+            namespaces[namespace] = ranges
+
+        # Train the configured index type once enough vectors are collected
+        if (isinstance(index, faiss.IndexFlat) and self.index_factory != "Flat"
+                and index.ntotal >= self.train_size):
+            index = self._rebuild_index(index, self.index_factory)
+        return index
+
+    def flush(self):
+        """
+        Save the index and namespace files and clear the upsert log.
+        """
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self):
         faiss.write_index(self.index, self.index_file)
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata, f)
-        with open(self.id_mapping_file, 'w') as f:
-            json.dump(self.id_mapping, f)
-        
-        logger.debug(f"Upserted {len(vectors)} vectors to FAISS index")
+        with open(self.namespaces_file, 'wb') as f:
+            f.write(orjson.dumps(self.namespaces))
+        for path in (self.upsert_log_file, self.vector_log_file):
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending = 0
+        logger.debug(f"Flushed FAISS index {self.index_name} ({self.index.ntotal} vectors)")
+
+    def _replay_log(self):
+        """
+        Re-apply upserts logged since the last flush. Entries already in the saved
+        index (a crash between saving and clearing the log) are skipped, and a
+        partially written tail is dropped so later appends stay aligned.
+        """
+        lines = []
+        if os.path.exists(self.upsert_log_file):
+            with open(self.upsert_log_file, 'rb') as f:
+                lines = f.readlines()
+        vectors = np.empty((0, self.index.d), dtype=np.float32)
+        if os.path.exists(self.vector_log_file):
+            vectors = np.fromfile(self.vector_log_file, dtype=np.float32)
+            vectors = vectors[:len(vectors) - len(vectors) % self.index.d].reshape(-1, self.index.d)
+
+        offset = 0
+        kept = []
+        for line in lines:
+            try:
+                entry = orjson.loads(line)
+            except ValueError:
+                break
+            rows = vectors[offset:offset + entry["count"]]
+            if not line.endswith(b"\n") or len(rows) < entry["count"]:
+                break
+            offset += len(rows)
+            kept.append(line)
+            if entry["start"] >= self.index.ntotal:
+                self.index = self._add(self.index, self.namespaces, rows, entry["namespace"])
+                self.pending += len(rows)
+
+        if len(kept) < len(lines) or offset < len(vectors) or (lines and not kept):
+            with open(self.vector_log_file, 'wb') as f:
+                f.write(vectors[:offset].tobytes())
+            with open(self.upsert_log_file, 'wb') as f:
+                f.writelines(kept)
+        elif not lines and os.path.exists(self.vector_log_file):
+            os.remove(self.vector_log_file)
+        if self.pending:
+            logger.info(f"Replayed {self.pending} logged vectors into FAISS index {self.index_name}")
+
+    async def upsert_async(self, vectors: List[tuple], namespace: Optional[str] = None):
+        """
+        Same as upsert(), run in a worker thread. Searches only wait for the swap
+        to the updated index, not for the add.
+        """
+        await asyncio.to_thread(self.upsert, vectors, namespace)
     
-    def query(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True) -> List[Dict]:
+    def query(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True,
+              namespace: Optional[str] = None) -> List[Dict]:
         """
         Query the FAISS index to find top_k similar vectors.
         
@@ -171,49 +702,242 @@ class FAISSClient:
             embedding (List[float]): Query embedding vector.
             top_k (int): Number of top results to return.
             include_metadata (bool): Whether to include metadata in results.
+            namespace (str): Restrict the search to this namespace (whole index if None).
         
         Returns:
             List[Dict]: List of matching items with 'id', 'score', and optionally 'metadata'.
         """
-        if self.index.ntotal == 0:
-            return []
-        
-        # Convert query to numpy and normalize
-        query_np = np.array([embedding], dtype=np.float32)
-        faiss.normalize_L2(query_np)
+        return self.query_batch([embedding], top_k=top_k, include_metadata=include_metadata,
+                                namespace=namespace)[0]
+
+    def query_batch(self, embeddings: List[List[float]], top_k: int = 5, include_metadata: bool = True,
+                    namespace: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Query the FAISS index for several embeddings with a single search call.
+
+        Args:
+            embeddings (List[List[float]]): Query embedding vectors.
+            top_k (int): Number of top results to return per query.
+            include_metadata (bool): Whether to include metadata in results.
+            namespace (str): Restrict the search to this namespace (whole index if None).
+
+        Returns:
+            List[List[Dict]]: Matches for each query, in the order of `embeddings`.
+        """
+        self._open_store()
+        with self._lock.read():
+            if self.index.ntotal == 0 or not embeddings:
+                return [[] for _ in embeddings]
+
+            if namespace is not None and namespace not in self.namespaces:
+                return [[] for _ in embeddings]
         
-        # Search
-        scores, indices = self.index.search(query_np, min(top_k, self.index.ntotal))
+            # Copy queries into the reusable buffer and normalize in place
+            query_np = self._query_buffer(len(embeddings))
+            query_np[:] = embeddings
+            if not self.assume_normalized:
+                faiss.normalize_L2(query_np)
         
-        # Format results
+            # Answer what the similarity cache can, search the rest
+            results: List[Optional[List[Dict]]] = [None] * len(embeddings)
+            if self.query_cache is not None:
+                results = [self.query_cache.lookup(query, top_k, namespace, include_metadata) for query in query_np]
+            misses = [i for i, matches in enumerate(results) if matches is None]
+            if not misses:
+                return results
+            if len(misses) < len(results):
+                query_np = query_np[misses]
+
+            # Namespaces and flat indexes are scanned exactly over their ranges of FAISS
+            # indices; a filtered HNSW/IVF walk would find few vectors of a small namespace
+            k = min(top_k, self.index.ntotal)
+            exact = namespace is not None or isinstance(self.index, faiss.IndexFlat)
+            ranges = self.namespaces[namespace] if namespace is not None else [[0, self.index.ntotal]]
+            if exact:
+                scores, indices = self._exact_search(query_np, k, ranges)
+            else:
+                scores, indices = self.index.search(query_np, k, params=self._search_params())
+            rows = self._lookup(np.unique(indices[indices != -1]).tolist()) if include_metadata else {}
+            # Only exact results can answer later queries from the similarity cache
+            cacheable = self.query_cache is not None and include_metadata and exact
+            exhaustive = sum(end - start for start, end in ranges) <= top_k
+            for i, query, row_scores, row_indices in zip(misses, query_np, scores, indices):
+                results[i] = self._format_matches(row_scores, row_indices, rows, include_metadata)
+                if cacheable:
+                    self._cache_result(query, row_indices, results[i], top_k, namespace, exhaustive)
+            return results
+
+    async def query_async(self, embedding: List[float], top_k: int = 5, include_metadata: bool = True,
+                          namespace: Optional[str] = None) -> List[Dict]:
+        """
+        Same as query(), run in a worker thread so the event loop is not blocked.
+        """
+        return await asyncio.to_thread(self.query, embedding, top_k, include_metadata, namespace)
+
+    async def query_batch_async(self, embeddings: List[List[float]], top_k: int = 5,
+                                include_metadata: bool = True,
+                                namespace: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Same as query_batch(), run in a worker thread so the event loop is not blocked.
+        """
+        return await asyncio.to_thread(self.query_batch, embeddings, top_k, include_metadata, namespace)
+
+    def _exact_search(self, queries: np.ndarray, k: int, ranges: List[List[int]]):
+        """
+        Exact inner-product search over the given row ranges. Flat indexes are
+        scanned in place; other types have the rows reconstructed (decoded) first.
+        The rows are split into shards scanned by parallel threads (FAISS releases
+        the GIL) and the top-k merged, since IndexFlat only parallelizes across
+        queries.
+        """
+        index = self.index
+        if isinstance(index, faiss.IndexFlat):
+            xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(-1, index.d)
+
+            def rows(start, end):
+                return xb[start:end]
+        else:
+            def rows(start, end):
+                return index.reconstruct_n(start, end - start)
+        shards = []
+        for start, end in ranges:
+            n_shards = max(1, min(self.search_threads, (end - start) // FLAT_SHARD_MIN_ROWS))
+            bounds = np.linspace(start, end, n_shards + 1).astype(np.int64).tolist()
+            shards.extend((lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo)
+
+        def search_shard(shard):
+            start, end = shard
+            scores, indices = faiss.knn(queries, rows(start, end), min(k, end - start),
+                                        metric=faiss.METRIC_INNER_PRODUCT)
+            return scores, indices + start
+
+        if self._search_pool is not None and len(shards) > 1:
+            parts = list(self._search_pool.map(search_shard, shards))
+        else:
+            parts = [search_shard(shard) for shard in shards]
+
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if parts:
+            all_scores = np.hstack([part[0] for part in parts])
+            all_indices = np.hstack([part[1] for part in parts])
+            order = np.argsort(-all_scores, axis=1, kind="stable")[:, :k]
+            scores[:, :order.shape[1]] = np.take_along_axis(all_scores, order, axis=1)
+            indices[:, :order.shape[1]] = np.take_along_axis(all_indices, order, axis=1)
+        return scores, indices
+
+    def _cache_result(self, query: np.ndarray, indices: np.ndarray, matches: List[Dict],
+                      top_k: int, namespace: Optional[str], exhaustive: bool):
+        """
+        Store an exact search result in the similarity cache with the vectors it refers to.
+        """
+        try:
+            vectors = self.index.reconstruct_batch(indices[:len(matches)])
+        except RuntimeError:
+            return  # index type without reconstruction, nothing to cache
+        self.query_cache.insert(query, namespace, matches, vectors, top_k, exhaustive)
+
+    def existing_ids(self, ids: List[str], namespace: Optional[str] = None) -> Set[str]:
+        """
+        The given vector IDs already stored in a namespace (the whole index if
+        None), e.g. chunks indexed before a restart.
+
+        Args:
+            ids (List[str]): Vector IDs to look for.
+            namespace (str): Namespace to look in.
+
+        Returns:
+            Set[str]: The IDs that were found.
+        """
+        self._open_store()
+        with self._lock.read():
+            if namespace is None:
+                stored = self._ids
+            elif namespace in self.namespaces:
+                stored = np.concatenate([self._ids[start:end] for start, end in self.namespaces[namespace]])
+            else:
+                return set()
+            return set(stored.tolist()).intersection(ids)
+
+    def _load_ids(self, db: sqlite3.Connection) -> np.ndarray:
+        """
+        Original vector IDs by FAISS index (an object array, so a row of search
+        results maps to its IDs in one indexing step), read from the metadata
+        store once. Indices without a stored ID fall back to their number.
+        """
+        ids = np.arange(self.index.ntotal).astype(str).astype(object)
+        rows = db.execute("SELECT faiss_idx, original_id FROM vectors WHERE faiss_idx < ?",
+                          (self.index.ntotal,)).fetchall()
+        if rows:
+            positions, original_ids = zip(*rows)
+            ids[list(positions)] = original_ids
+        return ids
+
+    def _lookup(self, indices: List[int]) -> Dict[int, bytes]:
+        """
+        Fetch the metadata blobs of FAISS indices from the metadata store.
+        """
+        if not indices:
+            return {}
+        placeholders = ",".join("?" * len(indices))
+        rows = self.db.execute(
+            f"SELECT faiss_idx, metadata FROM vectors WHERE faiss_idx IN ({placeholders})",
+            indices
+        ).fetchall()
+        return dict(rows)
+
+    def _query_buffer(self, n: int) -> np.ndarray:
+        """
+        A (n, d) float32 buffer for query vectors, reused across calls from the
+        same thread so queries don't allocate a fresh array each time.
+        """
+        buf = getattr(self._local, "query_buffer", None)
+        if buf is None or len(buf) < n:
+            buf = self._local.query_buffer = np.empty((n, self.index.d), dtype=np.float32)
+        return buf[:n]
+
+    def _format_matches(self, scores: np.ndarray, indices: np.ndarray, rows: Dict[int, bytes],
+                        include_metadata: bool) -> List[Dict]:
+        """
+        Turn one row of FAISS search results into match dicts.
+        """
+        found = np.count_nonzero(indices != -1)  # -1 pads missing results at the end
+        indices = indices[:found]
         matches = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx == -1:  # No more results
-                break
-            
-            # Map FAISS index back to original vector ID
-            faiss_idx = str(idx)
-            original_id = self.id_mapping.get(faiss_idx, faiss_idx)
-            
+        # Map FAISS indices back to original vector IDs in one step
+        for original_id, score, idx in zip(self._ids[indices].tolist(), scores[:found].tolist(),
+                                           indices.tolist()):
             match = {
                 'id': original_id,
-                'score': float(score)
+                'score': score
             }
             
-            if include_metadata and original_id in self.metadata:
-                match['metadata'] = self.metadata[original_id]
+            metadata = rows.get(idx)
+            if include_metadata and metadata is not None:
+                match['metadata'] = orjson.loads(metadata)
             
             matches.append(match)
         
         return matches
 
 
-def create_vector_client(index_name: str = "policy-index", dimension: int = 768) -> Union[PineconeClient, FAISSClient]:
+@functools.lru_cache(maxsize=8)
+def create_vector_client(index_name: str = "policy-index", dimension: int = 768,
+                         index_factory: str = "SQ8",
+                         query_cache_size: int = 0,
+                         assume_normalized: bool = False) -> Union[PineconeClient, FAISSClient]:
     """
     Create a vector database client, preferring Pinecone but falling back to FAISS.
+    Clients are cached per argument set, so repeated calls reuse the same
+    Pinecone connection or in-memory FAISS index.
     
     Args:
         index_name (str): Name of the index.
+        dimension (int): Vector dimension (FAISS only).
+        index_factory (str): FAISS index_factory description for a new FAISS index.
+        query_cache_size (int): Size of the FAISS client's SimilarityCache (0 disables it).
+        assume_normalized (bool): Embeddings are already unit length, so the FAISS
+            client skips normalizing them.
     
     Returns:
         Union[PineconeClient, FAISSClient]: Vector database client.
@@ -227,6 +951,7 @@ def create_vector_client(index_name: str = "policy-index", dimension: int = 768)
             logger.warning(f"Failed to initialize Pinecone client: {e}")
     
     if FAISS_AVAILABLE:
-        return FAISSClient(index_name=index_name, dimension=dimension)
+        return FAISSClient(index_name=index_name, dimension=dimension, index_factory=index_factory,
+                           query_cache_size=query_cache_size, assume_normalized=assume_normalized)
     
     raise RuntimeError("No vector database available (neither Pinecone nor FAISS)")
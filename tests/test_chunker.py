@@ -0,0 +1,78 @@
+import asyncio
+
+from app.services.chunker import chunk_text, chunk_tokens, iter_chunks
+
+
+def _reference_chunks(text, size, overlap):
+    words = text.split()
+    return [" ".join(words[start:start + size]) for start in range(0, len(words), size - overlap)]
+
+
+def test_chunks_match_word_windows():
+    """Chunks cover the same word windows as a plain split/join"""
+    text = "Grace period:\tthirty days.\n\nWaiting period for PED is 36 months — ६ पद　end "
+    for size, overlap in [(3, 1), (4, 0), (5, 4), (300, 50)]:
+        chunks = chunk_text(text, size=size, overlap=overlap)
+        assert [" ".join(c.split()) for c in chunks] == _reference_chunks(text, size, overlap)
+
+
+def test_chunks_are_slices_of_the_original_text():
+    text = "clause one\nclause two\nclause three"
+    assert chunk_text(text, size=4, overlap=2) == [
+        "clause one\nclause two",
+        "clause two\nclause three",
+        "clause three",
+    ]
+
+
+def test_lone_surrogates_are_words():
+    # Text extracted from broken PDFs can hold unpaired surrogates
+    assert chunk_text("a \ud800 b", size=1, overlap=0) == ["a", "\ud800", "b"]
+
+
+def test_blank_text_has_no_chunks():
+    assert chunk_text("") == []
+    assert chunk_text(" \n\t ") == []
+
+
+def test_streamed_chunks_match_joined_pages():
+    """iter_chunks over pages yields the same windows as chunk_text over the joined text"""
+    pages = ["alpha beta gamma", "", "delta\nepsilon", "zeta eta theta iota kappa", "lambda"]
+
+    async def page_stream():
+        for page in pages:
+            yield page
+
+    async def collect():
+        return [chunk async for chunk in iter_chunks(page_stream(), size=4, overlap=1)]
+
+    streamed = asyncio.run(collect())
+    expected = chunk_text("\n".join(pages), size=4, overlap=1)
+    assert [" ".join(c.split()) for c in streamed] == [" ".join(c.split()) for c in expected]
+
+
+class _CharEncoding:
+    """Stand-in for a tiktoken encoding with one token per character"""
+
+    def encode_ordinary(self, text):
+        return [ord(c) for c in text]
+
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+def test_token_windows():
+    assert chunk_tokens("abcdefg", _CharEncoding(), size=3, overlap=1) == ["abc", "cde", "efg", "g"]
+
+
+def test_streamed_token_chunks_match_joined_pages():
+    pages = ["abcde", "", "fgh", "ijklmnop"]
+
+    async def page_stream():
+        for page in pages:
+            yield page
+
+    async def collect():
+        return [chunk async for chunk in iter_chunks(page_stream(), size=4, overlap=1, encoding=_CharEncoding())]
+
+    assert asyncio.run(collect()) == chunk_tokens("\n".join(pages), _CharEncoding(), size=4, overlap=1)
@@ -0,0 +1,19 @@
+from app.services.clause_matching import KeywordIndex
+
+CHUNKS = [
+    "The grace period for premium payment is thirty days.",
+    "Maternity expenses are covered after a waiting period of 24 months.",
+    "Cataract surgery has a waiting period of two years.",
+    "Organ donor medical expenses are covered for harvesting the organ.",
+]
+
+
+def test_candidates_union_best_matches_per_question():
+    index = KeywordIndex(CHUNKS)
+    candidates = index.candidates(["What is the grace period?", "Is cataract surgery covered?"], top_m=1)
+    assert candidates == [0, 2]
+
+
+def test_candidates_cover_everything_when_document_is_small():
+    index = KeywordIndex(CHUNKS)
+    assert index.candidates(["anything"], top_m=10) == [0, 1, 2, 3]
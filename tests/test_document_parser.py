@@ -8,3 +8,32 @@ try:
     print("First 200 chars:", text[:200])
 except Exception as e:
     print("Error:", e)
+
+
+def test_parallel_pages_spawn_while_pdfium_locked(monkeypatch):
+    import asyncio
+    import io
+    import pypdfium2 as pdfium
+    from app.core.config import settings
+    from app.services import document_parser
+
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(3):
+        pdf.new_page(100, 100)
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    pdf.close()
+
+    monkeypatch.setattr(settings, "PDF_WORKERS", 2)
+    monkeypatch.setattr(document_parser, "_process_pool", None)
+
+    async def collect():
+        return [page async for page in document_parser._iter_pdf_pages_parallel(buffer.getvalue(), 3)]
+
+    # Workers must not inherit the lock held by this thread
+    with document_parser._pdfium_lock:
+        try:
+            pages = asyncio.run(asyncio.wait_for(collect(), timeout=60))
+        finally:
+            document_parser.shutdown_process_pool()
+    assert pages == ["", "", ""]
@@ -0,0 +1,179 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services import embedding_engine
+
+
+def test_batch_only_embeds_cache_misses(monkeypatch):
+    """Cached texts are not re-sent and results keep the input order"""
+    sent = []
+
+    async def fake_batch(texts, provider):
+        sent.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embedding_engine, "_embed_batch_uncached", fake_batch)
+    monkeypatch.setattr(embedding_engine, "_embedding_cache", embedding_engine.OrderedDict())
+
+    first = asyncio.run(embedding_engine.get_embeddings_batch(["a", "bb", "a"], provider="gemini"))
+    second = asyncio.run(embedding_engine.get_embeddings_batch(["ccc", "bb"], provider="gemini"))
+
+    assert first == [[1.0], [2.0], [1.0]]
+    assert second == [[3.0], [2.0]]
+    assert sent == [["a", "bb"], ["ccc"]]
+
+
+def test_http_session_is_shared_per_event_loop():
+    """Calls on one loop share a session; a new loop gets a fresh one"""
+    async def two_sessions():
+        first = await embedding_engine._get_session()
+        second = await embedding_engine._get_session()
+        return first, second
+
+    first, second = asyncio.run(two_sessions())
+    assert first is second
+
+    third, _ = asyncio.run(two_sessions())
+    assert third is not first
+    asyncio.run(embedding_engine.close_session())
+
+
+def test_gemini_embedding_round_trip(monkeypatch):
+    """The Gemini embedding call posts a JSON body and decodes the JSON reply"""
+    from aiohttp import web
+
+    received = []
+
+    async def embed_content(request):
+        received.append((request.content_type, await request.json()))
+        return web.json_response({"embedding": {"values": [0.25, 0.5]}})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/embedContent", embed_content)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(embedding_engine, "GEMINI_EMBED_URL", f"http://127.0.0.1:{port}/embedContent")
+        try:
+            return await embedding_engine._get_gemini_embedding("grace period")
+        finally:
+            await embedding_engine.close_session()
+            await runner.cleanup()
+
+    monkeypatch.setattr(embedding_engine, "GEMINI_API_KEY", "test-key")
+    assert asyncio.run(run()) == [0.25, 0.5]
+    content_type, body = received[0]
+    assert content_type == "application/json"
+    assert body["content"]["parts"][0]["text"] == "grace period"
+
+
+def test_gemini_batch_splits_into_api_sized_requests(monkeypatch):
+    """Gemini batches go through batchEmbedContents in chunks of the API limit"""
+    calls = []
+
+    async def fake_batch_call(texts):
+        calls.append(len(texts))
+        return [[float(text), 1.0] for text in texts]
+
+    monkeypatch.setattr(embedding_engine, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(embedding_engine, "GEMINI_BATCH_LIMIT", 2)
+    monkeypatch.setattr(embedding_engine, "_get_gemini_embeddings_batch", fake_batch_call)
+
+    texts = [str(i) for i in range(5)]
+    result = asyncio.run(embedding_engine._embed_batch_uncached(texts, provider="gemini"))
+
+    assert [round(x / y, 5) for x, y in result] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert calls == [2, 2, 1]
+
+
+def test_openai_embeddings_run_concurrently(monkeypatch):
+    """OpenAI embedding calls are awaited, so concurrent requests overlap"""
+    from types import SimpleNamespace
+
+    in_flight = []
+    peak = []
+
+    async def create(model, input):
+        in_flight.append(input)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.0] * (len(input) - 1) + [2.0])])
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    monkeypatch.setattr(embedding_engine, "openai_client", client)
+    monkeypatch.setitem(embedding_engine.PROVIDER_DISPATCH, "openai", embedding_engine._get_openai_embedding)
+
+    async def run():
+        return await asyncio.gather(*[embedding_engine._embed_uncached(text, "openai") for text in ["a", "bb", "ccc"]])
+
+    assert asyncio.run(run()) == [[1.0], [0.0, 1.0], [0.0, 0.0, 1.0]]
+    assert max(peak) == 3
+
+
+def test_normalize_rows():
+    """Batch embeddings come back unit length, leaving all-zero rows alone"""
+    arr = np.array([[3.0, 4.0], [0.0, 0.0], [0.0, 2.0]], dtype=np.float32)
+    out = embedding_engine._normalize_rows(arr)
+    assert np.allclose(out, [[0.6, 0.8], [0.0, 0.0], [0.0, 1.0]])
+
+
+def _serve_gemini(monkeypatch, statuses):
+    """Run a fake Gemini embedContent endpoint replying with the given statuses in turn"""
+    from aiohttp import web
+
+    replies = list(statuses)
+    calls = []
+
+    async def embed_content(request):
+        calls.append(request.path)
+        status = replies.pop(0)
+        if status != 200:
+            return web.Response(status=status, text="busy", headers={"Retry-After": "0"})
+        return web.json_response({"embedding": {"values": [1.0]}})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/embedContent", embed_content)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(embedding_engine, "GEMINI_EMBED_URL", f"http://127.0.0.1:{port}/embedContent")
+        try:
+            return await embedding_engine._get_gemini_embedding("text")
+        finally:
+            await embedding_engine.close_session()
+            await runner.cleanup()
+
+    monkeypatch.setattr(embedding_engine, "GEMINI_API_KEY", "test-key")
+    return run, calls
+
+
+def test_gemini_retries_rate_limited_requests(monkeypatch):
+    """429/5xx replies are retried until the call succeeds"""
+    run, calls = _serve_gemini(monkeypatch, [429, 503, 200])
+    assert asyncio.run(run()) == [1.0]
+    assert len(calls) == 3
+
+
+def test_gemini_does_not_retry_client_errors(monkeypatch):
+    """Other error statuses raise on the first reply"""
+    run, calls = _serve_gemini(monkeypatch, [400, 200])
+    with pytest.raises(Exception, match="Gemini Embedding API error 400"):
+        asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_retry_delay_honors_retry_after():
+    """A numeric Retry-After wins up to the backoff cap; otherwise the jittered backoff is capped"""
+    assert embedding_engine._retry_delay(0, "2") == 2.0
+    assert embedding_engine._retry_delay(0, "60") == embedding_engine.RETRY_MAX_BACKOFF
+    for attempt in range(10):
+        assert 0 <= embedding_engine._retry_delay(attempt, None) <= embedding_engine.RETRY_MAX_BACKOFF
@@ -0,0 +1,103 @@
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from app.api import endpoints
+from app.core.config import settings
+from app.models.schemas import QueryRequest
+from app.services.vector_search import FAISSClient
+
+CHUNKS = [f"clause {i} about topic{i}" for i in range(12)]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """run_query against a local FAISS store, with extraction, embeddings and the LLM faked"""
+    embedded = []
+
+    async def fake_chunks(doc_url, doc_type):
+        await asyncio.sleep(0.01)
+        for chunk in CHUNKS:
+            yield chunk
+
+    async def fake_embeddings(texts, provider):
+        embedded.extend(texts)
+        await asyncio.sleep(0.01)
+        return [np.eye(16)[len(text) % 16].tolist() for text in texts]
+
+    async def fake_answer(question, relevant_chunks, provider):
+        return "answer", "rationale"
+
+    async def fake_clauses(chunks, scores, question):
+        return []
+
+    def connect():
+        client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=16, index_factory="Flat")
+        monkeypatch.setattr(endpoints, "vector_client", client)
+        monkeypatch.setattr(endpoints, "indexed_documents", OrderedDict())
+        monkeypatch.setattr(endpoints, "_document_locks", OrderedDict())
+        return client
+
+    monkeypatch.setattr(endpoints, "fingerprint_document", lambda url: "doc")
+    monkeypatch.setattr(endpoints, "_iter_document_chunks", fake_chunks)
+    monkeypatch.setattr(endpoints, "get_embeddings_batch", fake_embeddings)
+    monkeypatch.setattr(endpoints, "generate_intelligent_answer", fake_answer)
+    monkeypatch.setattr(endpoints, "create_clause_explanations", fake_clauses)
+    return connect, embedded
+
+
+def _run(*question_sets):
+    async def run():
+        return await asyncio.gather(*[
+            endpoints.run_query(QueryRequest(documents="http://x/a.pdf", questions=questions))
+            for questions in question_sets
+        ])
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("top_m", [0, 50])
+def test_concurrent_requests_index_a_document_once(api, monkeypatch, top_m):
+    """Overlapping first requests for a document embed each chunk once"""
+    connect, embedded = api
+    monkeypatch.setattr(settings, "BM25_PREFILTER_TOP_M", top_m)
+    client = connect()
+    _run(["topic1?"], ["topic2?"])
+    assert client.index.ntotal == len(CHUNKS)
+
+
+@pytest.mark.parametrize("top_m", [0, 50])
+def test_restart_does_not_index_a_document_again(api, monkeypatch, top_m):
+    """Chunks stored before a restart are not embedded and upserted again"""
+    connect, embedded = api
+    monkeypatch.setattr(settings, "BM25_PREFILTER_TOP_M", top_m)
+    client = connect()
+    _run(["topic1?"])
+    assert client.index.ntotal == len(CHUNKS)
+
+    embedded.clear()
+    client.flush()
+    client = connect()  # a restarted process reloads the saved index
+    _run(["topic3?"])
+    assert client.index.ntotal == len(CHUNKS)
+    assert embedded == ["topic3?"]
+
+
+def test_indexed_documents_are_bounded(api, monkeypatch):
+    """Only the most recent documents are kept, and fully indexed ones drop their lock"""
+    connect, embedded = api
+    monkeypatch.setattr(settings, "BM25_PREFILTER_TOP_M", 0)
+    monkeypatch.setattr(settings, "INDEXED_DOCUMENTS_CACHE_SIZE", 2)
+    doc_ids = iter(["doc1", "doc2", "doc3", "doc1"])
+    monkeypatch.setattr(endpoints, "fingerprint_document", lambda url: next(doc_ids))
+    client = connect()
+    for _ in range(3):
+        _run(["topic1?"])
+    assert list(endpoints.indexed_documents) == ["doc2", "doc3"]
+    assert not endpoints._document_locks
+
+    # An evicted document is reloaded from the vector DB, not indexed again
+    _run(["topic1?"])
+    assert client.index.ntotal == 3 * len(CHUNKS)
+    assert list(endpoints.indexed_documents) == ["doc3", "doc1"]
@@ -0,0 +1,36 @@
+import threading
+import time
+
+from app.utils.helpers import ReadWriteLock
+
+
+def test_read_write_lock_shares_reads_and_excludes_writes():
+    """Readers overlap each other but never a writer"""
+    lock = ReadWriteLock()
+    state = {"readers": 0, "max_readers": 0, "overlap": False}
+    guard = threading.Lock()
+
+    def read():
+        with lock.read():
+            with guard:
+                state["readers"] += 1
+                state["max_readers"] = max(state["max_readers"], state["readers"])
+            time.sleep(0.02)
+            with guard:
+                state["readers"] -= 1
+
+    def write():
+        with lock.write():
+            with guard:
+                state["overlap"] |= state["readers"] > 0
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=write)]
+    threads += [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state["max_readers"] > 1
+    assert not state["overlap"]
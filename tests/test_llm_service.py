@@ -0,0 +1,45 @@
+import asyncio
+
+from app.core.config import settings
+from app.services import embedding_engine
+from app.services.llm_service import create_clause_explanations
+
+
+def test_clause_explanations_fall_back_per_chunk(monkeypatch):
+    """A failed explanation call only affects its own clause"""
+    monkeypatch.setattr(settings, "EXPLAIN_WITH_LLM", True)
+
+    async def fake_response(prompt, max_tokens=512, temperature=0.7):
+        if "broken" in prompt:
+            raise RuntimeError("Gemini API error 500")
+        return "  Mentions the grace period.  "
+
+    monkeypatch.setattr(embedding_engine, "generate_gemini_response", fake_response)
+
+    clauses = asyncio.run(create_clause_explanations(
+        chunks=["grace period of thirty days", "broken chunk"],
+        scores=[0.91, 0.42],
+        question="What is the grace period?"
+    ))
+
+    assert [c.text for c in clauses] == ["grace period of thirty days", "broken chunk"]
+    assert clauses[0].explanation == "Relevance score: 0.910 - Mentions the grace period."
+    assert clauses[1].explanation.startswith("Semantic similarity score: 0.420")
+
+
+def test_clause_explanations_are_templated_locally_by_default(monkeypatch):
+    """Without EXPLAIN_WITH_LLM no LLM call is made"""
+    async def fail(*args, **kwargs):
+        raise AssertionError("LLM should not be called")
+
+    monkeypatch.setattr(embedding_engine, "generate_gemini_response", fail)
+    monkeypatch.setattr(settings, "EXPLAIN_WITH_LLM", False)
+
+    clauses = asyncio.run(create_clause_explanations(
+        chunks=["The grace period for premium payment is thirty days.", "Unrelated text."],
+        scores=[0.8771, 0.1],
+        question="What is the grace period for premium payment?"
+    ))
+
+    assert clauses[0].explanation == "Relevance score: 0.877 - Shares the terms grace, period, premium, payment with the question."
+    assert clauses[1].explanation.startswith("Semantic similarity score: 0.100")
@@ -0,0 +1,420 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+import pytest
+
+from app.services import vector_search
+from app.services.vector_search import FAISSClient, PineconeClient, create_vector_client
+
+
+def _vectors(prefix, embeddings):
+    return [(f"{prefix}-{i}", emb, {"text": f"{prefix} chunk {i}"}) for i, emb in enumerate(embeddings)]
+
+
+def test_faiss_query_is_scoped_to_namespace(tmp_path):
+    """Queries with a namespace only return vectors upserted into it"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4)
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("doc-a", eye[:2]), namespace="doc-a")
+    client.upsert(_vectors("doc-b", eye[2:]), namespace="doc-b")
+
+    matches = client.query(eye[2], top_k=5, namespace="doc-a")
+    assert {m["id"] for m in matches} == {"doc-a-0", "doc-a-1"}
+
+    matches = client.query(eye[2], top_k=1, namespace="doc-b")
+    assert matches[0]["id"] == "doc-b-0"
+    assert matches[0]["metadata"]["text"] == "doc-b chunk 0"
+
+    assert client.query(eye[0], top_k=5, namespace="unknown") == []
+
+
+def test_faiss_namespaces_survive_reload(tmp_path):
+    """A reloaded index keeps its namespace ranges"""
+    name = str(tmp_path / "idx")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    FAISSClient(index_name=name, dimension=4).upsert(_vectors("doc-a", eye[:3]), namespace="doc-a")
+
+    reloaded = FAISSClient(index_name=name, dimension=4)
+    matches = reloaded.query(eye[1], top_k=1, namespace="doc-a")
+    assert matches[0]["id"] == "doc-a-1"
+
+
+def test_faiss_metadata_store_opens_on_first_use(tmp_path):
+    """Creating a client writes no files; the metadata store is opened by the first upsert or query"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4)
+    assert list(tmp_path.iterdir()) == []
+    assert client.query([1.0, 0.0, 0.0, 0.0], top_k=1) == []
+    assert (tmp_path / "idx.db").exists()
+
+
+def test_faiss_trains_index_once_train_size_reached(tmp_path):
+    """Index types that need training (SQ8/IVF/PQ) stay exact until train_size vectors are stored"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((64, 16)).astype(np.float32)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=16, index_factory="IVF4,Flat",
+                         nprobe=4, train_size=48)
+    client.upsert(_vectors("a", embeddings[:32].tolist()), namespace="a")
+    assert isinstance(client.index, faiss.IndexFlat)
+
+    client.upsert(_vectors("b", embeddings[32:].tolist()), namespace="b")
+    assert isinstance(client.index, faiss.IndexIVF) and client.index.is_trained
+    assert client.index.ntotal == 64
+    assert client.query(embeddings[10].tolist(), top_k=1, namespace="a")[0]["id"] == "a-10"
+    assert client.query(embeddings[40].tolist(), top_k=1, namespace="b")[0]["id"] == "b-8"
+
+
+def test_faiss_namespace_spans_several_upserts(tmp_path):
+    """Vectors added to a namespace later are found alongside the earlier ones"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, index_factory="Flat")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("doc-a", eye[:1]), namespace="doc-a")
+    client.upsert(_vectors("doc-b", eye[1:2]), namespace="doc-b")
+    client.upsert([("doc-a-1", eye[2], {"text": "doc-a chunk 1"})], namespace="doc-a")
+
+    matches = client.query(eye[1], top_k=5, namespace="doc-a")
+    assert {m["id"] for m in matches} == {"doc-a-0", "doc-a-1"}
+
+
+def test_pinecone_upsert_sends_batches_concurrently():
+    """Streamed upserts split into 100-vector async requests that are in flight together"""
+    calls = []
+    in_flight = []
+    lock = threading.Lock()
+    pool = ThreadPoolExecutor(max_workers=4)
+
+    class FakeIndex:
+        def upsert(self, vectors, namespace, async_req=False):
+            def send():
+                with lock:
+                    in_flight.append(len(vectors))
+                    calls.append((len(vectors), namespace, len(in_flight)))
+                time.sleep(0.05)
+                with lock:
+                    in_flight.pop()
+            return pool.submit(send)
+
+    client = PineconeClient.__new__(PineconeClient)
+    client.index = FakeIndex()
+    vectors = _vectors("doc", [[0.0, 1.0]] * 250)
+    asyncio.run(client.upsert_async(iter(vectors), namespace="doc"))
+    pool.shutdown()
+
+    assert sorted(size for size, _, _ in calls) == [50, 100, 100]
+    assert {namespace for _, namespace, _ in calls} == {"doc"}
+    assert max(concurrent for _, _, concurrent in calls) > 1
+
+
+def test_faiss_rebuilds_saved_flat_index(tmp_path):
+    """A brute-force index saved by an older version is reloaded as an HNSW index"""
+    name = str(tmp_path / "idx")
+    flat = FAISSClient(index_name=name, dimension=4, index_factory="Flat")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    flat.upsert(_vectors("doc-a", eye), namespace="doc-a")
+    flat.flush()
+    assert isinstance(faiss.read_index(f"{name}.faiss"), faiss.IndexFlat)
+
+    reloaded = FAISSClient(index_name=name, dimension=4, index_factory="HNSW32,SQ8", train_size=4)
+    assert isinstance(reloaded.index, faiss.IndexHNSW)
+    assert reloaded.query(eye[2], top_k=1, namespace="doc-a")[0]["id"] == "doc-a-2"
+    reloaded.flush()
+    assert isinstance(faiss.read_index(f"{name}.faiss"), faiss.IndexHNSW)
+
+
+def test_faiss_upserts_are_logged_until_flush(tmp_path):
+    """Upserts append to a log that a reload replays; flush() saves the index and clears it"""
+    name = str(tmp_path / "idx")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client = FAISSClient(index_name=name, dimension=4)
+    client.upsert(_vectors("doc-a", eye[:2]), namespace="doc-a")
+    client.upsert(_vectors("doc-b", eye[2:]), namespace="doc-b")
+    assert not (tmp_path / "idx.faiss").exists()
+
+    replayed = FAISSClient(index_name=name, dimension=4)
+    assert replayed.index.ntotal == 4
+    assert replayed.query(eye[3], top_k=1, namespace="doc-b")[0]["id"] == "doc-b-1"
+
+    replayed.flush()
+    assert not (tmp_path / "idx_upserts.jsonl").exists()
+    reloaded = FAISSClient(index_name=name, dimension=4)
+    assert reloaded.index.ntotal == 4 and reloaded.pending == 0
+    assert reloaded.query(eye[0], top_k=1, namespace="doc-a")[0]["metadata"]["text"] == "doc-a chunk 0"
+
+
+def test_faiss_log_replay_drops_torn_tail(tmp_path):
+    """A log entry whose vectors were not fully written is discarded on reload"""
+    name = str(tmp_path / "idx")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client = FAISSClient(index_name=name, dimension=4)
+    client.upsert(_vectors("doc-a", eye[:2]), namespace="doc-a")
+    client.upsert(_vectors("doc-b", eye[2:]), namespace="doc-b")
+    log = tmp_path / "idx_vectors.log"
+    log.write_bytes(log.read_bytes()[:-4])
+
+    replayed = FAISSClient(index_name=name, dimension=4)
+    assert replayed.index.ntotal == 2
+    assert replayed.query(eye[0], top_k=5, namespace="doc-b") == []
+
+    replayed.upsert(_vectors("doc-c", eye[3:]), namespace="doc-c")
+    again = FAISSClient(index_name=name, dimension=4)
+    assert again.query(eye[3], top_k=1, namespace="doc-c")[0]["id"] == "doc-c-0"
+
+
+def test_faiss_query_batch_matches_single_queries(tmp_path):
+    """One batched search returns the same matches as querying each embedding alone"""
+    rng = np.random.default_rng(1)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=8)
+    client.upsert(_vectors("doc", rng.random((50, 8)).tolist()), namespace="doc")
+    queries = rng.random((3, 8)).tolist()
+
+    batched = client.query_batch(queries, top_k=4, namespace="doc")
+    assert batched == [client.query(q, top_k=4, namespace="doc") for q in queries]
+    assert client.query_batch(queries, top_k=4, namespace="unknown") == [[], [], []]
+
+
+def test_faiss_query_reuses_buffer(tmp_path):
+    """Repeated queries share one buffer without results leaking between calls"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4)
+    eye = np.eye(4, dtype=np.float32)
+    client.upsert(_vectors("doc", eye.tolist()), namespace="doc")
+
+    first = client.query(eye[1] * 3, top_k=1, namespace="doc")
+    buffer = client._query_buffer(1)
+    second = client.query(eye[2], top_k=1, namespace="doc")
+    assert client._query_buffer(1).base is buffer.base
+    assert (first[0]["id"], second[0]["id"]) == ("doc-1", "doc-2")
+    assert abs(first[0]["score"] - 1.0) < 1e-5
+
+
+def test_faiss_imports_legacy_json_metadata(tmp_path):
+    """Metadata and ID mappings from the old JSON files are moved into SQLite"""
+    name = str(tmp_path / "idx")
+    index = faiss.IndexFlatIP(4)
+    index.add(np.eye(4, dtype=np.float32)[:2])
+    faiss.write_index(index, f"{name}.faiss")
+    (tmp_path / "idx_id_mapping.json").write_text(json.dumps({"0": "a", "1": "b"}))
+    (tmp_path / "idx_metadata.json").write_text(json.dumps({"a": {"text": "first"}, "b": {"text": "second"}}))
+
+    client = FAISSClient(index_name=name, dimension=4)
+    match = client.query([0.0, 1.0, 0.0, 0.0], top_k=1)[0]
+    assert (match["id"], match["metadata"]) == ("b", {"text": "second"})
+    assert "metadata" not in client.query([0.0, 1.0, 0.0, 0.0], top_k=1, include_metadata=False)[0]
+
+
+def test_similarity_cache_answers_nearby_queries_exactly(tmp_path):
+    """Queries inside a cached query's hyperball get the exact top-k without a search"""
+    rng = np.random.default_rng(2)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=16, index_factory="Flat",
+                         query_cache_size=8)
+    client.upsert(_vectors("doc", rng.standard_normal((300, 16)).tolist()), namespace="doc")
+    query = rng.standard_normal(16)
+    client.query(query.tolist(), top_k=20, namespace="doc")
+
+    nearby = query + rng.standard_normal(16) * 0.01
+    nearby_np = (nearby / np.linalg.norm(nearby)).astype(np.float32)
+    cached = client.query_cache.lookup(nearby_np, 5, "doc")
+    assert cached is not None
+    client.query_cache = None
+    exact = client.query(nearby.tolist(), top_k=5, namespace="doc")
+    assert [m["id"] for m in cached] == [m["id"] for m in exact]
+    assert np.allclose([m["score"] for m in cached], [m["score"] for m in exact], atol=1e-5)
+
+
+def test_similarity_cache_is_invalidated_by_upserts(tmp_path):
+    """Vectors upserted into a namespace show up in later results for cached queries"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, query_cache_size=8)
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("old", eye[1:]), namespace="doc")
+    query = [1.0, 0.2, 0.0, 0.0]
+    assert client.query(query, top_k=1, namespace="doc")[0]["id"] == "old-0"
+
+    client.upsert(_vectors("new", eye[:1]), namespace="doc")
+    assert client.query(query, top_k=1, namespace="doc")[0]["id"] == "new-0"
+
+
+def test_similarity_cache_only_keeps_exact_results(tmp_path):
+    """Approximate HNSW results and short non-exhaustive results are not cached"""
+    rng = np.random.default_rng(4)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=16, index_factory="HNSW32,SQ8",
+                         train_size=100, query_cache_size=8)
+    client.upsert(_vectors("doc", rng.standard_normal((200, 16)).tolist()), namespace="doc")
+    assert isinstance(client.index, faiss.IndexHNSW)
+    client.query(rng.standard_normal(16).tolist(), top_k=5)
+    assert client.query_cache.lookup(np.eye(16, dtype=np.float32)[0], 5, None) is None
+    assert not client.query_cache._order
+
+    client.query(rng.standard_normal(16).tolist(), top_k=5, namespace="doc")
+    assert len(client.query_cache._order) == 1
+
+    cache = vector_search.SimilarityCache(8)
+    query = np.eye(4, dtype=np.float32)[0]
+    cache.insert(query, "doc", [{"id": "a", "score": 1.0}], query[None, :], top_k=5)
+    assert not cache._order
+    cache.insert(query, "doc", [{"id": "a", "score": 1.0}], query[None, :], top_k=5, exhaustive=True)
+    assert cache.lookup(query, 5, "doc") == [{"id": "a", "score": 1.0}]
+
+
+def test_create_vector_client_is_cached(tmp_path, monkeypatch):
+    """Repeated calls with the same arguments share one client"""
+    monkeypatch.delenv("PINECONE_API_KEY", raising=False)
+    name = str(tmp_path / "idx")
+    first = create_vector_client(index_name=name, dimension=4)
+    assert create_vector_client(index_name=name, dimension=4) is first
+    assert create_vector_client(index_name=name, dimension=8) is not first
+
+
+def test_pinecone_client_and_index_are_shared(monkeypatch):
+    """Pinecone clients reuse one connection and one Index handle per index name"""
+    created = []
+
+    class FakePinecone:
+        def __init__(self, api_key):
+            created.append(api_key)
+
+        def list_indexes(self):
+            created.append("list")
+            return [type("IndexInfo", (), {"name": "policy-index"})()]
+
+        def Index(self, name, **kwargs):
+            return object()
+
+    monkeypatch.setattr(vector_search, "Pinecone", FakePinecone, raising=False)
+    monkeypatch.setattr(vector_search, "PINECONE_GRPC_AVAILABLE", False)
+    monkeypatch.setattr(vector_search, "_pinecone_clients", {})
+    monkeypatch.setattr(vector_search, "_pinecone_indexes", {})
+
+    first = PineconeClient(api_key="key", index_name="policy-index")
+    second = PineconeClient(api_key="key", index_name="policy-index")
+    assert first.index is second.index
+    assert created == ["key", "list"]
+
+
+def test_faiss_flat_search_merges_shards(tmp_path, monkeypatch):
+    """Sharded exact search returns the same results as a plain IndexFlatIP search"""
+    monkeypatch.setattr(vector_search, "FLAT_SHARD_MIN_ROWS", 16)
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((200, 8)).astype(np.float32)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=8, index_factory="Flat", search_threads=4)
+    client.upsert(_vectors("a", vectors[:120].tolist()), namespace="a")
+    client.upsert(_vectors("b", vectors[120:].tolist()), namespace="b")
+
+    reference = faiss.IndexFlatIP(8)
+    normalized = vectors.copy()
+    faiss.normalize_L2(normalized)
+    reference.add(normalized)
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    _, expected = reference.search(queries, 10)
+
+    results = client.query_batch(queries.tolist(), top_k=10)
+    assert [[m["id"] for m in row] for row in results] == \
+        [[f"a-{i}" if i < 120 else f"b-{i - 120}" for i in row] for row in expected.tolist()]
+    assert all(m["id"].startswith("b-") for m in client.query(queries[0].tolist(), top_k=100, namespace="b"))
+    assert len(client.query(queries[0].tolist(), top_k=100, namespace="b")) == 80
+
+
+def test_faiss_upsert_arrays_matches_upsert(tmp_path):
+    """Vectors given as parallel arrays are stored like upserted tuples"""
+    rng = np.random.default_rng(5)
+    embeddings = rng.standard_normal((20, 8)).astype(np.float32)
+    tuples = FAISSClient(index_name=str(tmp_path / "tuples"), dimension=8, index_factory="Flat")
+    tuples.upsert(_vectors("doc", embeddings.tolist()), namespace="doc")
+    arrays = FAISSClient(index_name=str(tmp_path / "arrays"), dimension=8, index_factory="Flat")
+    arrays.upsert_arrays(np.array([f"doc-{i}" for i in range(20)]), embeddings.copy(),
+                         [{"text": f"doc chunk {i}"} for i in range(20)], namespace="doc")
+
+    assert arrays.namespaces == tuples.namespaces
+    query = embeddings[7].tolist()
+    assert arrays.query(query, top_k=3, namespace="doc") == tuples.query(query, top_k=3, namespace="doc")
+
+
+def test_faiss_async_queries_run_off_the_event_loop(tmp_path):
+    """query_async/query_batch_async return the same matches as the blocking calls"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, index_factory="Flat")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("doc", eye), namespace="doc")
+
+    async def run():
+        return await asyncio.gather(
+            client.query_async(eye[1], top_k=2, namespace="doc"),
+            client.query_batch_async(eye, top_k=1, namespace="doc"),
+        )
+
+    single, batch = asyncio.run(run())
+    assert single == client.query(eye[1], top_k=2, namespace="doc")
+    assert [matches[0]["id"] for matches in batch] == ["doc-0", "doc-1", "doc-2", "doc-3"]
+
+
+def test_faiss_upsert_swaps_in_updated_index(tmp_path):
+    """Upserts build a new index and leave the one searches were using untouched"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, index_factory="Flat")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("a", eye), namespace="a")
+    live_index, live_namespaces = client.index, client.namespaces
+
+    client.upsert(_vectors("a", eye), namespace="a")
+    assert live_index.ntotal == 4 and live_namespaces == {"a": [[0, 4]]}
+    assert client.index is not live_index and client.index.ntotal == 8
+    assert client.namespaces == {"a": [[0, 8]]}
+
+
+def test_faiss_assume_normalized_uses_embeddings_as_given(tmp_path):
+    """With assume_normalized, stored and query vectors are not rescaled"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, index_factory="Flat",
+                         assume_normalized=True)
+    embeddings = np.eye(4, dtype=np.float32) * 2
+    client.upsert_arrays(["a", "b", "c", "d"], embeddings, [{}] * 4)
+
+    assert client.index.reconstruct(0)[0] == 2.0
+    assert client.query([0.0, 0.5, 0.0, 0.0], top_k=1)[0]["score"] == pytest.approx(1.0)
+
+
+def test_faiss_thread_budget(monkeypatch):
+    """FAISS_NUM_THREADS overrides the default of half the available CPUs"""
+    monkeypatch.setenv("FAISS_NUM_THREADS", "3")
+    assert vector_search._faiss_thread_budget() == 3
+    monkeypatch.delenv("FAISS_NUM_THREADS")
+    assert 1 <= vector_search._faiss_thread_budget() <= max(1, (os.cpu_count() or 1) // 2)
+
+
+def test_faiss_namespace_query_on_hnsw_returns_top_k(tmp_path):
+    """Small namespaces of a large HNSW index still get top_k matches"""
+    rng = np.random.default_rng(0)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=32, index_factory="HNSW32,SQ8",
+                         train_size=1000)
+    for doc in range(40):
+        cluster = rng.standard_normal(32) + 0.3 * rng.standard_normal((50, 32))
+        client.upsert(_vectors(f"d{doc}", cluster.astype(np.float32).tolist()), namespace=f"d{doc}")
+    assert isinstance(client.index, faiss.IndexHNSW)
+
+    for doc in range(40):
+        matches = client.query(rng.standard_normal(32).tolist(), top_k=5, namespace=f"d{doc}")
+        assert len(matches) == 5
+        assert all(match["id"].startswith(f"d{doc}-") for match in matches)
+
+
+def test_faiss_existing_ids_are_scoped_to_namespace(tmp_path):
+    """existing_ids reports which of the given IDs a namespace already stores"""
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=4, index_factory="Flat")
+    eye = np.eye(4, dtype=np.float32).tolist()
+    client.upsert(_vectors("a", eye[:2]), namespace="a")
+    client.upsert(_vectors("b", eye[2:]), namespace="b")
+
+    assert client.existing_ids(["a-0", "a-1", "a-2", "b-0"], namespace="a") == {"a-0", "a-1"}
+    assert client.existing_ids(["a-0", "b-1"]) == {"a-0", "b-1"}
+    assert client.existing_ids(["a-0"], namespace="missing") == set()
+
+
+def test_faiss_default_index_is_graph_free(tmp_path):
+    """The default index is trained into int8 codes without an HNSW graph"""
+    rng = np.random.default_rng(5)
+    client = FAISSClient(index_name=str(tmp_path / "idx"), dimension=16, train_size=100)
+    vectors = rng.standard_normal((200, 16)).astype(np.float32)
+    client.upsert(_vectors("doc", vectors.tolist()), namespace="doc")
+    assert isinstance(client.index, faiss.IndexScalarQuantizer)
+    assert client.query(vectors[7].tolist(), top_k=1, namespace="doc")[0]["id"] == "doc-7"